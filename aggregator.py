@@ -0,0 +1,230 @@
+"""Federated view over several main.py lot instances.
+
+Polls each registered lot's /api/all_data?since= and /api/hourly_stats over a small pool of keep-alive
+connections, caches the snapshots and serves one combined free/reserved/occupied view. Reservations are
+routed to the lot that owns the slot. A slow or dead lot only makes its own part of the view stale.
+
+    python aggregator.py --lots lots.json --port 5000
+    # lots.json: [{"name": "north", "url": "http://127.0.0.1:5001"}, {"name": "south", "url": "http://127.0.0.1:5002"}]
+"""
+import argparse
+import http.client
+import json
+import queue
+import threading
+import time
+import urllib.parse
+from flask import Flask, Response, jsonify, request
+
+app = Flask(__name__)
+POLL_INTERVAL = 1.0
+HOURLY_INTERVAL = 60
+FULL_REFRESH = 60
+REQUEST_TIMEOUT = 2.0
+STALE_AFTER = 10.0
+MAX_BACKOFF = 30.0
+POOL_SIZE = 4
+POOL_IDLE = 4.0  # below common server keep-alive timeouts (uvicorn defaults to 5 s)
+
+# --- [Lot Nodes] ---
+class LotNode:
+    """One registered lot instance: a bounded pool of keep-alive HTTP connections and the last snapshot it served.
+    A poller thread per node keeps the cache fresh, so API reads never wait on a lot."""
+    def __init__(self, name, url, pool_size=POOL_SIZE, timeout=REQUEST_TIMEOUT):
+        parts = urllib.parse.urlsplit(url)
+        if parts.scheme != "http" or not parts.hostname: raise ValueError(f"lot url must be http://host:port, got {url!r}")
+        self.name, self.url, self.host, self.port = name, url, parts.hostname, parts.port or 80
+        self.pool, self.pool_size, self.timeout = queue.LifoQueue(), pool_size, timeout
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        self.version, self.stats, self.slots = 0, {}, {}
+        self.hourly, self.hourly_at, self.full_at = None, 0, 0
+        self.last_ok, self.last_error, self.latency, self.failures = 0, None, None, 0
+
+    def _connection(self):
+        """A pooled connection used within POOL_IDLE seconds, else a new one; older ones may already have been
+        closed by the lot, which a non-idempotent POST could not safely retry."""
+        while True:
+            try: conn, last_used = self.pool.get_nowait()
+            except queue.Empty: return http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+            if time.monotonic() - last_used < POOL_IDLE: return conn
+            conn.close()
+
+    def request(self, method, path, body=None, retry=True):
+        """(status, body bytes). Connections go back to the pool unless the server closed them; a GET on a
+        pooled connection the server already dropped is retried once on a fresh one."""
+        conn = self._connection()
+        fresh = conn.sock is None
+        try:
+            headers = {"Content-Type": "application/json"} if body is not None else {}
+            conn.request(method, path, body=None if body is None else json.dumps(body), headers=headers)
+            resp = conn.getresponse()
+            data = resp.read()
+        except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+            conn.close()
+            if retry and not fresh and method == "GET": return self.request(method, path, body, retry=False)
+            raise
+        except Exception:
+            conn.close(); raise
+        if resp.will_close or self.pool.qsize() >= self.pool_size: conn.close()
+        else: self.pool.put((conn, time.monotonic()))
+        return resp.status, data
+
+    def poll(self):
+        now = time.monotonic()
+        full = not self.version or now - self.full_at > FULL_REFRESH  # a restarted lot answers a stale since with a full snapshot
+        status, data = self.request("GET", "/api/all_data" if full else f"/api/all_data?since={self.version}")
+        if status not in (200, 304): raise IOError(f"/api/all_data returned {status}")
+        payload = json.loads(data) if status == 200 else None
+        hourly = None
+        if now - self.hourly_at > HOURLY_INTERVAL:
+            h_status, h_data = self.request("GET", "/api/hourly_stats")
+            if h_status == 200: hourly = json.loads(h_data)
+        with self.lock:
+            if payload is not None:
+                if payload.get("delta"):
+                    for s in payload["slots"]: self.slots[s["id"]] = {**self.slots.get(s["id"], {}), **s}
+                else:
+                    self.slots = {s["id"]: s for s in payload["slots"]}
+                    self.full_at = now
+                self.version, self.stats = payload["version"], payload["stats"]
+            if hourly is not None: self.hourly, self.hourly_at = hourly, now
+            self.last_ok, self.last_error, self.failures = time.monotonic(), None, 0
+            self.latency = round(time.monotonic() - now, 4)
+
+    def run(self, stop_event):
+        while not stop_event.is_set():
+            try: self.poll()
+            except Exception as e:
+                with self.lock: self.last_error, self.failures = f"{type(e).__name__}: {e}", self.failures + 1
+            delay = min(POLL_INTERVAL * 2 ** min(self.failures, 5), MAX_BACKOFF) if self.failures else POLL_INTERVAL
+            self.wake.wait(delay); self.wake.clear()
+
+    def health(self):
+        """"ok", "stale" (cached data older than STALE_AFTER) or "down" (never answered)."""
+        if not self.last_ok: return "down"
+        return "ok" if time.monotonic() - self.last_ok < STALE_AFTER else "stale"
+
+    def describe(self):
+        with self.lock:
+            return {"name": self.name, "url": self.url, "health": self.health(), "version": self.version, "stats": self.stats,
+                    "age": round(time.monotonic() - self.last_ok, 1) if self.last_ok else None,
+                    "latency": self.latency, "error": self.last_error}
+
+class Registry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.nodes = {}
+        self.stop_event = threading.Event()
+        self.cached = (None, None)
+
+    def register(self, name, url):
+        node = LotNode(name, url)
+        with self.lock:
+            if name in self.nodes: raise ValueError(f"lot {name!r} is already registered")
+            self.nodes[name] = node
+        threading.Thread(target=node.run, args=(self.stop_event,), daemon=True).start()
+        return node
+
+    def all(self):
+        with self.lock: return list(self.nodes.values())
+
+    def get(self, name):
+        if not isinstance(name, str): return None
+        with self.lock: return self.nodes.get(name)
+
+    def combined(self):
+        """(etag, payload) for the merged view; rebuilt only when some lot's version or health changed."""
+        nodes = self.all()
+        key = "-".join(f"{n.name}.{n.version}.{n.health()}" for n in nodes)
+        cached_key, payload = self.cached
+        if key == cached_key: return key, payload
+        totals, lots, merged = {"free": 0, "total": 0, "reserved": 0, "occupied": 0}, {}, []
+        for n in nodes:
+            with n.lock: health, stats, slots = n.health(), dict(n.stats), list(n.slots.values())
+            lots[n.name] = {"health": health, "stats": stats}
+            for k in totals: totals[k] += stats.get(k, 0)
+            merged += [{**s, "lot": n.name, "stale": health != "ok"} for s in slots]
+        payload = {"stats": totals, "lots": lots, "slots": merged}
+        self.cached = (key, payload)
+        return key, payload
+
+registry = Registry()
+
+# --- [API Routes] ---
+@app.route('/api/all_data')
+def get_all_data():
+    etag, payload = registry.combined()
+    if request.if_none_match.contains(etag): resp = Response(status=304)
+    else: resp = jsonify(payload)
+    resp.set_etag(etag)
+    return resp
+
+@app.route('/api/hourly_stats')
+def get_hourly_stats():
+    today, average = [0] * 24, [0] * 24
+    for n in registry.all():
+        with n.lock: hourly = n.hourly
+        if not hourly: continue
+        today = [a + b for a, b in zip(today, hourly["today"])]
+        average = [round(a + b, 1) for a, b in zip(average, hourly["average"])]
+    return jsonify({"today": today, "average": average})
+
+@app.route('/api/lots')
+def get_lots():
+    return jsonify([n.describe() for n in registry.all()])
+
+@app.route('/api/lots', methods=['POST'])
+def register_lot():
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict): return jsonify({"status": "error", "reason": "body must be a JSON object"}), 400
+    try: node = registry.register(str(body["name"]), str(body["url"]))
+    except (KeyError, ValueError) as e: return jsonify({"status": "error", "reason": str(e)}), 400
+    return jsonify({"status": "success", "lot": node.describe()})
+
+def forward(node, path, body):
+    """Proxies a reservation call to the owning lot and refreshes that lot's cache right after."""
+    try: status, data = node.request("POST", path, body)
+    except (TimeoutError, OSError, http.client.HTTPException) as e:
+        return jsonify({"status": "error", "lot": node.name, "reason": f"lot unreachable: {type(e).__name__}"}), 504
+    node.wake.set()
+    return Response(data, status=status, mimetype='application/json')
+
+def route_slot_op(op):
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict): return jsonify({"status": "error", "reason": "body must be a JSON object"}), 400
+    node = registry.get(body.get("lot"))
+    if node is None: return jsonify({"status": "error", "reason": "unknown lot"}), 404
+    return forward(node, f"/api/{op}", {"slot_id": body.get("slot_id")})
+
+@app.route('/api/reserve', methods=['POST'])
+def reserve_slot():
+    return route_slot_op("reserve")
+
+@app.route('/api/extend', methods=['POST'])
+def extend_slot():
+    return route_slot_op("extend")
+
+@app.route('/api/cancel', methods=['POST'])
+def cancel_slot():
+    return route_slot_op("cancel")
+
+@app.route('/api/batch', methods=['POST'])
+def batch_reservations():
+    """{"lot": name, "ops": [...], "all_or_nothing": bool}, forwarded as-is to one lot's /api/batch;
+    all_or_nothing cannot span lots, so a batch always targets a single lot."""
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict): return jsonify({"status": "error", "reason": "body must be a JSON object"}), 400
+    node = registry.get(body.get("lot"))
+    if node is None: return jsonify({"status": "error", "reason": "unknown lot"}), 404
+    return forward(node, "/api/batch", {"ops": body.get("ops"), "all_or_nothing": bool(body.get("all_or_nothing"))})
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lots", help='JSON list of {"name": ..., "url": "http://host:port"}; more can be added with POST /api/lots')
+    parser.add_argument("--port", type=int, default=5000)
+    args = parser.parse_args()
+    if args.lots:
+        with open(args.lots) as f:
+            for lot in json.load(f): registry.register(lot["name"], lot["url"])
+    app.run(host='0.0.0.0', port=args.port, threaded=True, use_reloader=False)
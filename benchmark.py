@@ -0,0 +1,88 @@
+"""Offline benchmark for the analysis core in main.py.
+
+Reports mean per-stage timings (motion gate, ROI crop + grayscale + downscale, grayscale of uncropped input, blur, adaptive threshold,
+per-slot scoring, state update, overlay, JPEG encode) and frames/sec for each frame size x slot layout.
+
+    python benchmark.py                                  # synthetic frames
+    python benchmark.py --video lot.mp4 --frames 300     # replay a recording
+    python benchmark.py --sizes 640x480,3840x2160 --layouts master
+    python benchmark.py --sizes 3840x2160 --analysis-scale 0.5 --stream-size 1280x720
+"""
+import argparse
+import numpy as np
+
+import main
+
+STAGES = ["motion", "crop", "grayscale", "blur", "threshold", "scoring", "state", "overlay", "encode"]
+LAYOUT_SIZE = (640, 480)  # resolution parking_master_data.json was drawn at
+
+def synthetic_layout(n, width, height):
+    """n rectangular slots laid out on a grid that fills the frame."""
+    cols = int(np.ceil(np.sqrt(n * width / height)))
+    rows = int(np.ceil(n / cols))
+    cw, ch = width / cols, height / rows
+    layout = []
+    for i in range(n):
+        x, y = (i % cols) * cw, (i // cols) * ch
+        pts = [[x + 0.1 * cw, y + 0.1 * ch], [x + 0.9 * cw, y + 0.1 * ch], [x + 0.9 * cw, y + 0.9 * ch], [x + 0.1 * cw, y + 0.9 * ch]]
+        layout.append([[[int(px), int(py)] for px, py in pts], 0, 0, 0, False, main.DEFAULT_GPS, False])
+    return layout
+
+def scaled_layout(rows, width, height):
+    sx, sy = width / LAYOUT_SIZE[0], height / LAYOUT_SIZE[1]
+    return [[[[int(x * sx), int(y * sy)] for x, y in r[0]]] + r[1:] for r in rows]
+
+def synthetic_frames(width, height, n, seed=0):
+    rng = np.random.default_rng(seed)
+    base = rng.integers(60, 200, (height, width, 3), dtype=np.uint8)
+    frames = []
+    for i in range(n):
+        img = base.copy()
+        for _ in range(20):  # "cars" that move between frames
+            x, y = rng.integers(0, width - 40), rng.integers(0, height - 30)
+            img[y:y + 30, x:x + 40] = rng.integers(0, 255, 3, dtype=np.uint8)
+        frames.append(img)
+    return frames
+
+def load_video(path, width, height, n):
+    frames = []
+    for img in main.iter_frames(path):
+        frames.append(main.cv2.resize(img, (width, height)) if img.shape[1::-1] != (width, height) else img)
+        if len(frames) >= n: break
+    return frames
+
+def run(frames, layout, encode=True, motion_gate=False, analysis_scale=1.0, roi_crop=True, stream_size=None):
+    timer = main.StageTimer()
+    store = main.SlotStore.from_rows(layout)
+    n, elapsed = main.replay(frames, store, overlay=True, encode=encode, timer=timer, motion_gate=motion_gate,
+                             analysis_scale=analysis_scale, roi_crop=roi_crop, stream_size=stream_size)
+    return timer.mean_ms(), n / elapsed if elapsed else 0.0
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--video", help="video file, image directory or glob to replay instead of synthetic frames")
+    parser.add_argument("--frames", type=int, default=50)
+    parser.add_argument("--sizes", default="640x480,1280x720,1920x1080")
+    parser.add_argument("--layouts", default="master,synthetic1000", help="comma list of: master, synthetic<N>")
+    parser.add_argument("--no-encode", action="store_true", help="skip the overlay JPEG encode stage")
+    parser.add_argument("--motion-gate", action="store_true", help="only rescore slots whose region changed")
+    parser.add_argument("--analysis-scale", type=float, default=1.0, help="downscale factor for the analysed ROI")
+    parser.add_argument("--no-roi-crop", action="store_true", help="analyse the whole frame instead of the slot ROI")
+    parser.add_argument("--stream-size", type=main.parse_size, help="encode the overlay at this WxH instead of the frame size")
+    args = parser.parse_args()
+
+    sizes = [tuple(int(v) for v in s.split("x")) for s in args.sizes.split(",")]
+    print(f"{'size':>10} {'layout':>18} " + " ".join(f"{s:>9}" for s in STAGES) + f" {'fps':>8}")
+    for width, height in sizes:
+        frames = load_video(args.video, width, height, args.frames) if args.video else synthetic_frames(width, height, args.frames)
+        for name in args.layouts.split(","):
+            if name == "master": layout = scaled_layout(main.load_data(main.SAVE_FILE), width, height)
+            else: layout = synthetic_layout(int(name.replace("synthetic", "")), width, height)
+            stages, fps = run(frames, layout, encode=not args.no_encode, motion_gate=args.motion_gate,
+                              analysis_scale=args.analysis_scale, roi_crop=not args.no_roi_crop, stream_size=args.stream_size)
+            cells = " ".join(f"{stages[s]:9.3f}" if s in stages else f"{'-':>9}" for s in STAGES)
+            print(f"{f'{width}x{height}':>10} {name + '/' + str(len(layout)):>18} {cells} {fps:8.1f}")
+    print("stage columns are mean milliseconds per frame")
+
+if __name__ == "__main__":
+    main_cli()
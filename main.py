@@ -5,28 +5,199 @@ import os
 import time
 import threading
 import csv
+import glob
+import queue
 import copy
+import atexit
+import argparse
+import collections
+import contextlib
+import bisect
+import itertools
+import heapq
+import asyncio
+import io
+import sys
+import urllib.parse
+import multiprocessing as mp
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import shared_memory
 from datetime import datetime
 from flask import Flask, Response, jsonify, request
+try: import uvicorn
+except ImportError: uvicorn = None
 
 # --- [ตั้งค่าพื้นฐาน] ---
 app = Flask(__name__)
 SAVE_FILE = "parking_master_data.json"
 LOG_FILE = "parking_history.csv"
+ROLLUP_FILE = "parking_hourly_rollup.json"
+ROLLUP_SAVE_INTERVAL = 60
+LOG_FLUSH_INTERVAL = 1.0
+LOG_FLUSH_SIZE = 256
+LOG_ROTATE_BYTES = 10 * 1024 * 1024
+LOG_ROTATE_DAILY = False
+LOG_QUEUE_MAX = 100000
+LOG_RETRY_INTERVAL = 5.0
 BUSY_RATIO_THRESHOLD = 0.12 
 RESERVE_TIMEOUT = 90 
 OCCUPY_DELAY = 3 
+DEFAULT_GPS = "18.573077155796554,99.00090305034648"
+ANALYSIS_INTERVAL = 0.5
+ANALYSIS_FAST_INTERVAL = 0.2
+ANALYSIS_SLOW_INTERVAL = 2.0
+MOTION_GATE = True
+MOTION_SCALE = 0.25
+MOTION_PIXEL_DELTA = 25
+MOTION_SLOT_FRACTION = 0.02
+MOTION_IDLE_AFTER = OCCUPY_DELAY + 2
+MOTION_REFRESH = 30
+FRAME_SHM_BYTES = 4 * 1024 * 1024
+PIPELINE_QUEUE_SIZE = 2
+DROP_POLICY = "latest"
+STREAM_MAX_FPS = 20
+STATE_HISTORY = 256
+MAX_BATCH_OPS = 500
+CAPTURE_SIZE = (640, 480)
+ANALYSIS_SCALE = 1.0
+ROI_CROP = True
+ROI_MARGIN = 16
+STREAM_SIZE = None
+STREAM_OVERLAY = "public"
+SAVE_DEBOUNCE = 1.0
+INDEX_CELL = 64
+VERTEX_RADIUS = 12
+ASYNC_MAX_CONNECTIONS = 5000
+ASYNC_MAX_STREAMS = 4000
+ASYNC_SEND_TIMEOUT = 10
+ASYNC_IDLE_TIMEOUT = 30
+ASYNC_KEEPALIVE = 15
+ASYNC_WSGI_THREADS = 8
+ASYNC_MAX_BODY = 1024 * 1024
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+SIZE_BUCKETS = (16e3, 32e3, 64e3, 128e3, 256e3, 512e3, 1e6, 2e6)
+
+# --- [Metrics] ---
+class Metrics:
+    """Small in-process registry rendered in Prometheus text format: counters, gauges, fixed-bucket
+    histograms, and collectors that are evaluated only when /metrics is scraped."""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.meta, self.values, self.hists, self.collectors = {}, {}, {}, {}
+
+    def define(self, name, kind, help, buckets=None):
+        self.meta[name] = (kind, help, buckets)
+
+    def collector(self, name, kind, help, fn):
+        """fn() returns [(labels dict, value), ...] at scrape time."""
+        self.meta[name] = (kind, help, None)
+        self.collectors[name] = fn
+
+    def inc(self, name, n=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock: self.values[key] = self.values.get(key, 0) + n
+
+    def set(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock: self.values[key] = value
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        buckets = self.meta[name][2]
+        i = bisect.bisect_left(buckets, value)
+        with self.lock:
+            h = self.hists.get(key)
+            if h is None: h = self.hists[key] = [0] * (len(buckets) + 1) + [0.0]
+            h[i] += 1
+            h[-1] += value
+
+    @staticmethod
+    def _labels(labels, extra=()):
+        items = list(labels) + list(extra)
+        return "{" + ",".join(f'{k}="{v}"' for k, v in items) + "}" if items else ""
+
+    def render(self):
+        with self.lock:
+            values, hists = dict(self.values), {k: list(v) for k, v in self.hists.items()}
+        lines = []
+        for name, (kind, help, buckets) in self.meta.items():
+            lines += [f"# HELP {name} {help}", f"# TYPE {name} {kind}"]
+            if name in self.collectors:
+                for labels, value in self.collectors[name]():
+                    lines.append(f"{name}{self._labels(sorted(labels.items()))} {value}")
+            elif kind == "histogram":
+                for (n, labels), h in hists.items():
+                    if n != name: continue
+                    cumulative = 0
+                    for le, count in zip(list(buckets) + ["+Inf"], h[:-1]):
+                        cumulative += count
+                        lines.append(f"{name}_bucket{self._labels(labels, [('le', le)])} {cumulative}")
+                    lines.append(f"{name}_sum{self._labels(labels)} {h[-1]}")
+                    lines.append(f"{name}_count{self._labels(labels)} {cumulative}")
+            else:
+                lines += [f"{name}{self._labels(labels)} {v}" for (n, labels), v in values.items() if n == name]
+        return "\n".join(lines) + "\n"
+
+class MetricsTimer:
+    """StageTimer-compatible: each stage is observed into a `stage`-labelled histogram."""
+    def __init__(self, name):
+        self.name = name
+
+    @contextlib.contextmanager
+    def stage(self, stage):
+        start = time.perf_counter()
+        try: yield
+        finally: metrics.observe(self.name, time.perf_counter() - start, stage=stage)
+
+class InstrumentedLock:
+    """threading.Lock that records how long callers wait for it and how long it is held."""
+    def __init__(self, name):
+        self._lock, self.name, self._acquired_at = threading.Lock(), name, 0
+
+    def acquire(self, blocking=True, timeout=-1):
+        start = time.perf_counter()
+        ok = self._lock.acquire(blocking, timeout)
+        if ok:
+            self._acquired_at = time.perf_counter()
+            metrics.observe("parking_lock_wait_seconds", self._acquired_at - start, lock=self.name)
+        return ok
+
+    def release(self):
+        held = time.perf_counter() - self._acquired_at
+        self._lock.release()
+        metrics.observe("parking_lock_hold_seconds", held, lock=self.name)
+
+    __enter__ = acquire
+
+    def __exit__(self, *exc):
+        self.release()
+
+metrics = Metrics()
+metrics.define("parking_frames_captured_total", "counter", "Frames read from the camera")
+metrics.define("parking_capture_failures_total", "counter", "Failed camera reads")
+metrics.define("parking_capture_fps", "gauge", "Camera frames per second over the last second")
+metrics.define("parking_analysis_tick_seconds", "histogram", "Duration of one analysis tick", LATENCY_BUCKETS)
+metrics.define("parking_analysis_stage_seconds", "histogram", "Duration of each analysis stage", LATENCY_BUCKETS)
+metrics.define("parking_jpeg_encode_seconds", "histogram", "JPEG encode time for the stream", LATENCY_BUCKETS)
+metrics.define("parking_jpeg_bytes", "histogram", "Encoded stream frame size", SIZE_BUCKETS)
+metrics.define("parking_lock_wait_seconds", "histogram", "Time spent waiting for the global lock", LATENCY_BUCKETS)
+metrics.define("parking_lock_hold_seconds", "histogram", "Time the global lock was held", LATENCY_BUCKETS)
+metrics.define("parking_http_request_seconds", "histogram", "Flask route latency until the response is returned", LATENCY_BUCKETS)
+metrics.define("parking_log_write_seconds", "histogram", "Time to append one batch of events to the log", LATENCY_BUCKETS)
+metrics.define("parking_log_events_total", "counter", "Events written to the log")
+metrics.define("parking_log_write_failures_total", "counter", "Log batch writes that failed and will be retried")
+metrics.define("parking_log_events_dropped_total", "counter", "Events discarded because the log backlog hit LOG_QUEUE_MAX")
+analysis_timer = MetricsTimer("parking_analysis_stage_seconds")
 
 # --- [ตัวแปรควบคุมระบบ] ---
-cap = cv2.VideoCapture(0)
-cap.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
-cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
+cap = None
+camera_pool = None
+slot_cameras = []
 
 parking_stats = {"free": 0, "total": 0, "reserved": 0, "occupied": 0}
-slots = [] 
 temp_points = [] 
-encoded_frame = None 
-lock = threading.Lock()
+lock = InstrumentedLock("global")
+stop_event = threading.Event()
 
 # Editor States
 selected_slot = -1
@@ -35,241 +206,1314 @@ is_dragging = False
 last_mouse_pos = (0, 0)
 mouse_curr = (0, 0)
 move_all_mode = False
-last_status = []
 copied_slot_data = None 
 
 # --- [ระบบจัดการข้อมูล & Logging] ---
-def load_data():
-    if os.path.exists(SAVE_FILE):
+def load_data(path=SAVE_FILE):
+    if os.path.exists(path):
         try:
-            with open(SAVE_FILE, "r") as f: return json.load(f)
+            with open(path, "r") as f: return json.load(f)
         except: return []
     return []
 
-def save_data(data):
-    clean_data = [[s[0], 0, 0, 0, False, s[5] if len(s)>5 else "18.573077155796554,99.00090305034648", s[6] if len(s)>6 else False] for s in data]
-    with open(SAVE_FILE, "w") as f: json.dump(clean_data, f)
+def write_atomic(path, text):
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f: f.write(text)
+    os.replace(tmp, path)
+
+class LayoutSaver:
+    """Debounced layout persistence: edits call request() and the layout is written once edits have been quiet
+    for SAVE_DEBOUNCE seconds, so a drag or a burst of key presses costs one write-then-rename instead of one each."""
+    def __init__(self, path=SAVE_FILE, delay=SAVE_DEBOUNCE):
+        self.path, self.delay = path, delay
+        self.cond = threading.Condition()
+        self.pending_since = None
+
+    def request(self):
+        with self.cond:
+            self.pending_since = time.monotonic()
+            self.cond.notify()
+
+    def run(self):
+        while not stop_event.is_set():
+            with self.cond:
+                if self.pending_since is None: self.cond.wait(1.0); continue
+                remaining = self.pending_since + self.delay - time.monotonic()
+                if remaining > 0: self.cond.wait(remaining); continue
+            self.flush()
+
+    def flush(self):
+        with self.cond:
+            if self.pending_since is None: return
+            self.pending_since = None
+        with lock: text = json.dumps(slots.to_rows())  # serialize under the lock, write outside it
+        write_atomic(self.path, text)
 
 def log_event(slot_id, event_type, status_code):
-    file_exists = os.path.isfile(LOG_FILE)
-    with open(LOG_FILE, mode='a', newline='', encoding='utf-8') as f:
-        writer = csv.writer(f)
-        if not file_exists:
-            writer.writerow(["Timestamp", "Slot_ID", "Event", "Status_Code"])
-        now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        writer.writerow([now, slot_id + 1, event_type, status_code])
+    event_writer.log(slot_id, event_type, status_code)
+
+def rotated_logs(log_file=LOG_FILE):
+    base, ext = os.path.splitext(log_file)
+    return sorted(glob.glob(base + ".*" + ext))
+
+class EventWriter:
+    """Buffers log rows in memory; a background thread appends them to the CSV in batches every
+    `flush_interval` seconds or `flush_size` rows, rotating the file by size and/or date. A failed write is
+    reported and retried every LOG_RETRY_INTERVAL seconds; at most LOG_QUEUE_MAX events are held meanwhile."""
+    def __init__(self, path=LOG_FILE, flush_interval=LOG_FLUSH_INTERVAL, flush_size=LOG_FLUSH_SIZE,
+                 rotate_bytes=LOG_ROTATE_BYTES, rotate_daily=LOG_ROTATE_DAILY):
+        self.path, self.flush_interval, self.flush_size = path, flush_interval, flush_size
+        self.rotate_bytes, self.rotate_daily = rotate_bytes, rotate_daily
+        self.queue = queue.Queue(LOG_QUEUE_MAX)
+        self.write_lock = threading.Lock()
+        self.thread = None
+
+    def log(self, slot_id, event_type, status_code):
+        try: self.queue.put_nowait((datetime.now(), slot_id, event_type, status_code))
+        except queue.Full: metrics.inc("parking_log_events_dropped_total")
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def close(self, timeout=5):
+        if self.thread is None: return
+        try: self.queue.put(None, timeout=timeout)
+        except queue.Full: pass
+        self.thread.join(timeout)
+        self.thread = None
+
+    def _run(self):
+        stopping, pending = False, []
+        while not stopping:
+            try: batch = [self.queue.get(timeout=LOG_RETRY_INTERVAL if pending else None)]
+            except queue.Empty: batch = []
+            deadline = time.monotonic() + self.flush_interval
+            while batch and len(batch) < self.flush_size:
+                try: item = self.queue.get(timeout=max(0, deadline - time.monotonic()))
+                except queue.Empty: break
+                batch.append(item)
+            if None in batch:
+                stopping = True
+                batch = [e for e in batch if e is not None]
+            pending += batch
+            if not pending: continue
+            try:
+                self._write(pending)
+                pending = []
+            except Exception as e:
+                metrics.inc("parking_log_write_failures_total")
+                print(f"[EventWriter] writing {len(pending)} events to {self.path} failed, retrying: {e}", file=sys.stderr)
+                if len(pending) > LOG_QUEUE_MAX:
+                    metrics.inc("parking_log_events_dropped_total", len(pending) - LOG_QUEUE_MAX)
+                    pending = pending[-LOG_QUEUE_MAX:]
+
+    def _write(self, batch):
+        start = time.perf_counter()
+        rows = io.StringIO()
+        csv.writer(rows).writerows([[dt.strftime("%Y-%m-%d %H:%M:%S"), slot_id + 1, event_type, status_code]
+                                    for dt, slot_id, event_type, status_code in batch])
+        with self.write_lock:
+            self._maybe_rotate(batch[0][0])
+            file_exists = os.path.isfile(self.path)
+            with open(self.path, mode='a', newline='', encoding='utf-8') as f:
+                if not file_exists: csv.writer(f).writerow(["Timestamp", "Slot_ID", "Event", "Status_Code"])
+                f.write(rows.getvalue())  # one write, so a failed batch is not left half-appended
+                rollup.record([(dt, event_type) for dt, _, event_type, _ in batch], f.tell())
+        metrics.observe("parking_log_write_seconds", time.perf_counter() - start)
+        metrics.inc("parking_log_events_total", len(batch))
+
+    def _maybe_rotate(self, now):
+        if not os.path.isfile(self.path): return
+        st = os.stat(self.path)
+        too_big = self.rotate_bytes and st.st_size >= self.rotate_bytes
+        new_day = self.rotate_daily and datetime.fromtimestamp(st.st_mtime).date() != now.date()
+        if not (too_big or new_day): return
+        base, ext = os.path.splitext(self.path)
+        target, n = f"{base}.{now.strftime('%Y%m%d-%H%M%S')}{ext}", 1
+        while os.path.exists(target):
+            target, n = f"{base}.{now.strftime('%Y%m%d-%H%M%S')}-{n}{ext}", n + 1
+        os.replace(self.path, target)
+        rollup.log_rotated()
+
+    def rebuild_rollup(self):
+        with self.write_lock: rollup.rebuild()
+
+class HourlyRollup:
+    """Per-day, per-hour "Car Occupied" counts kept in step with the event log. The rollup file remembers how far
+    into the CSV it has counted, so startup only parses rows appended since the last save."""
+    def __init__(self, log_file=LOG_FILE, path=ROLLUP_FILE):
+        self.log_file, self.path = log_file, path
+        self.lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self.days, self.hour_totals, self.log_offset, self.dirty = {}, [0] * 24, 0, True
+
+    def _add(self, d_key, hour):
+        if d_key not in self.days: self.days[d_key] = [0] * 24
+        self.days[d_key][hour] += 1
+        self.hour_totals[hour] += 1
+
+    def _scan(self, offset, path=None):
+        path = path or self.log_file
+        if not os.path.exists(path): return
+        with open(path, mode='r', newline='', encoding='utf-8') as f:
+            f.seek(offset)
+            for row in csv.reader(f):
+                if len(row) < 3 or row[2].strip() != "Car Occupied": continue
+                try: dt = datetime.strptime(row[0].strip(), "%Y-%m-%d %H:%M:%S")
+                except ValueError: continue
+                self._add(dt.strftime("%Y-%m-%d"), dt.hour)
+            if path == self.log_file: self.log_offset = f.tell()
+
+    def record(self, events, log_offset):
+        with self.lock:
+            for dt, event_type in events:
+                if event_type == "Car Occupied": self._add(dt.strftime("%Y-%m-%d"), dt.hour)
+            self.log_offset, self.dirty = log_offset, True
+
+    def log_rotated(self):
+        with self.lock: self.log_offset, self.dirty = 0, True
+
+    def rebuild(self):
+        with self.lock:
+            self._reset()
+            for path in rotated_logs(self.log_file): self._scan(0, path)
+            self._scan(0)
+        self.save()
+
+    def load(self):
+        log_size = os.path.getsize(self.log_file) if os.path.exists(self.log_file) else 0
+        try:
+            with open(self.path, "r") as f: data = json.load(f)
+        except (OSError, ValueError): data = None
+        if not data or data.get("log_offset", 0) > log_size: return self.rebuild()
+        with self.lock:
+            self._reset()
+            for d_key, hours in data["days"].items():
+                self.days[d_key] = hours
+                for h in range(24): self.hour_totals[h] += hours[h]
+            self._scan(data["log_offset"])
+        self.save()
+
+    def save(self):
+        with self.lock:
+            if not self.dirty: return
+            write_atomic(self.path, json.dumps({"log_offset": self.log_offset, "days": self.days}))
+            self.dirty = False
+
+    def autosave(self, interval=ROLLUP_SAVE_INTERVAL):
+        while not stop_event.wait(interval): self.save()
+
+    def query(self):
+        today_str = datetime.now().strftime("%Y-%m-%d")
+        with self.lock:
+            today_stats = list(self.days.get(today_str, [0] * 24))
+            n_days = len(self.days)
+            avg_stats = [round(t / n_days, 1) for t in self.hour_totals] if n_days else [0] * 24
+        return today_stats, avg_stats
+
+rollup = HourlyRollup()
+event_writer = EventWriter()
+layout_saver = LayoutSaver()
+
+# --- [Slot Store] ---
+class Slot:
+    """Typed accessor for one row of a SlotStore."""
+    __slots__ = ("store", "index")
+
+    def __init__(self, store, index):
+        self.store, self.index = store, index
+
+    polygon = property(lambda self: self.store.polygons[self.index])
+    gps = property(lambda self: self.store.gps[self.index])
+    symmetric = property(lambda self: bool(self.store.symmetric[self.index]))
+
+    @polygon.setter
+    def polygon(self, pts):
+        self.store.polygons[self.index] = pts
+        self.store.geometry_changed()
+
+    def _column(name, cast):
+        def get(self): return cast(getattr(self.store, name)[self.index])
+        def set(self, value): getattr(self.store, name)[self.index] = value
+        return property(get, set)
+
+    status = _column("status", int)
+    reserve_time = _column("reserve_time", float)
+    dwell_start = _column("dwell_start", float)
+    arrived = _column("arrived", bool)
+    busy = _column("busy", bool)
+    del _column
+
+    def reset(self):
+        self.status, self.reserve_time, self.dwell_start, self.arrived = 0, 0, 0, False
+
+class SlotStore:
+    """Columnar slot state. Status, timestamps and flags live in NumPy arrays so the per-tick state machine
+    runs over all slots at once; polygons and GPS strings stay in parallel lists for the editor and layout file."""
+    COLUMNS = {"status": np.int8, "last_status": np.int8, "reserve_time": np.float64, "dwell_start": np.float64,
+               "arrived": bool, "busy": bool, "symmetric": bool}
+
+    def __init__(self):
+        self.polygons, self.gps = [], []
+        for name, dtype in self.COLUMNS.items(): setattr(self, name, np.zeros(0, dtype))
+        self.geometry_version = 0
+
+    @classmethod
+    def from_rows(cls, rows):
+        store = cls()
+        for row in rows: store.append(row[0], row[5] if len(row) > 5 else DEFAULT_GPS, row[6] if len(row) > 6 else False)
+        return store
+
+    def to_rows(self):
+        return [[p, 0, 0, 0, False, g, bool(sym)] for p, g, sym in zip(self.polygons, self.gps, self.symmetric)]
+
+    def __len__(self):
+        return len(self.polygons)
+
+    def __getitem__(self, i):
+        if not -len(self) <= i < len(self): raise IndexError(i)
+        return Slot(self, i % len(self))
+
+    def __iter__(self):
+        return (Slot(self, i) for i in range(len(self)))
+
+    def geometry_changed(self):
+        self.geometry_version += 1
+
+    def append(self, polygon, gps=DEFAULT_GPS, symmetric=False):
+        self.polygons.append(polygon); self.gps.append(gps)
+        for name, dtype in self.COLUMNS.items(): setattr(self, name, np.append(getattr(self, name), np.zeros(1, dtype)))
+        self.symmetric[-1] = symmetric
+        self.geometry_changed()
+
+    def pop(self, i):
+        self.polygons.pop(i); self.gps.pop(i)
+        for name in self.COLUMNS: setattr(self, name, np.delete(getattr(self, name), i))
+        self.geometry_changed()
+
+    def clear(self):
+        version = self.geometry_version
+        self.__init__()
+        self.geometry_version = version + 1
+
+    def step(self, busy, curr):
+        """Vectorized dwell / OCCUPY_DELAY transition for every slot (reservation expiry is ReservationEngine's job).
+        Returns the indices whose status changed since the last step."""
+        busy = np.asarray(busy, bool)
+        self.busy[:] = busy
+        self.dwell_start = np.where(busy, np.where(self.dwell_start == 0, curr, self.dwell_start), 0.0)
+        settled = busy & ((curr - self.dwell_start) > OCCUPY_DELAY)
+
+        reserved = self.status == 2
+        self.arrived[reserved] = settled[reserved]
+        self.status[~reserved] = settled[~reserved]
+        return self.take_changes()
+
+    def take_changes(self):
+        """Indices whose status differs from the last logged status; marks them as logged."""
+        changed = np.flatnonzero(self.status != self.last_status)
+        self.last_status[changed] = self.status[changed]
+        return changed
+
+slots = SlotStore()
+
+class SlotIndex:
+    """Uniform grid over slot vertices and polygon bounding boxes for editor hit-testing, so a click only looks
+    at the slots in its cell. Single-slot edits re-index that slot; anything else rebuilds on the next query."""
+    def __init__(self, cell=INDEX_CELL):
+        self.cell = cell
+        self.store, self.version = None, -1
+        self.vertices, self.boxes = collections.defaultdict(list), collections.defaultdict(set)
+        self.slot_cells = []
+
+    def _cells(self, x0, y0, x1, y1):
+        c = self.cell
+        return [(cx, cy) for cx in range(int(x0) // c, int(x1) // c + 1) for cy in range(int(y0) // c, int(y1) // c + 1)]
+
+    def _insert(self, i):
+        poly = self.store.polygons[i]
+        vcells = []
+        for j, (x, y) in enumerate(poly):
+            key = (int(x) // self.cell, int(y) // self.cell)
+            self.vertices[key].append((i, j)); vcells.append(key)
+        xs, ys = [p[0] for p in poly], [p[1] for p in poly]
+        bcells = self._cells(min(xs), min(ys), max(xs), max(ys))
+        for key in bcells: self.boxes[key].add(i)
+        self.slot_cells[i] = (vcells, bcells)
+
+    def _remove(self, i):
+        vcells, bcells = self.slot_cells[i]
+        for key in vcells: self.vertices[key] = [v for v in self.vertices[key] if v[0] != i]
+        for key in bcells: self.boxes[key].discard(i)
+
+    def sync(self, store):
+        if store is self.store and self.version == store.geometry_version: return
+        self.store, self.version = store, store.geometry_version
+        self.vertices.clear(); self.boxes.clear()
+        self.slot_cells = [None] * len(store)
+        for i in range(len(store)): self._insert(i)
+
+    def slot_changed(self, store, i, before):
+        """Re-index slot i after an edit to it alone (a drag or an append) made at geometry version `before`;
+        if the index was already stale it is left for sync() to rebuild."""
+        if store is not self.store or self.version != before: return
+        if i < len(self.slot_cells): self._remove(i)
+        else: self.slot_cells.append(None)
+        self._insert(i)
+        self.version = store.geometry_version
+
+    def vertex_at(self, store, x, y, radius=VERTEX_RADIUS):
+        """(slot, point) of the first vertex within radius of (x, y), in layout order, or None."""
+        self.sync(store)
+        hits = [(i, j) for key in self._cells(x - radius, y - radius, x + radius, y + radius) for i, j in self.vertices.get(key, ())
+                if np.hypot(store.polygons[i][j][0] - x, store.polygons[i][j][1] - y) < radius]
+        return min(hits) if hits else None
+
+    def polygon_at(self, store, x, y):
+        """Index of the first slot whose polygon contains (x, y), or -1."""
+        self.sync(store)
+        for i in sorted(self.boxes.get((int(x) // self.cell, int(y) // self.cell), ())):
+            if cv2.pointPolygonTest(np.array(store.polygons[i], np.int32), (x, y), False) >= 0: return i
+        return -1
+
+slot_index = SlotIndex()
+
+def parse_source(source):
+    return int(source) if isinstance(source, str) and source.isdigit() else source
+
+def parse_size(text):
+    w, h = text.lower().split("x")
+    return int(w), int(h)
+
+def open_capture(source, size=CAPTURE_SIZE):
+    capture = cv2.VideoCapture(parse_source(source))
+    capture.set(cv2.CAP_PROP_FRAME_WIDTH, size[0])
+    capture.set(cv2.CAP_PROP_FRAME_HEIGHT, size[1])
+    return capture
+
+def stream_frame(img, size=None):
+    """Resizes an overlaid frame to the stream output resolution (None keeps the capture resolution)."""
+    if not size or img.shape[1::-1] == tuple(size): return img
+    return cv2.resize(img, tuple(size), interpolation=cv2.INTER_AREA)
+
+# --- [Occupancy Engine] ---
+class OccupancyEngine:
+    """Caches each slot's cropped mask, bounding box and area so scoring only touches slot pixels.
+    Analysis runs on the grayscale union of slot bounding boxes (plus ROI_MARGIN) scaled by `scale`; layout polygons
+    are in capture-frame pixels and are mapped into that analysis image here. For scales like 1/2 or 1/4 the ROI is
+    snapped to a multiple of the factor so INTER_AREA takes OpenCV's fast integer path; other scales use INTER_LINEAR.
+    The cache is rebuilt when the store's geometry version or the frame size changes."""
+    def __init__(self, scale=1.0, crop=True):
+        self.scale, self.crop_roi = scale, crop
+        self.entries = []
+        self.shape = None
+        self.version = -1
+        self.roi, self.analysis_size, self.interpolation = None, None, cv2.INTER_LINEAR
+
+    def _build_roi(self, store, shape):
+        h_img, w_img = shape[:2]
+        x0, y0, x1, y1 = 0, 0, w_img, h_img
+        if self.crop_roi and len(store):
+            pts = np.array([p for poly in store.polygons for p in poly], np.float64)
+            x0, y0 = np.clip(np.floor(pts.min(0)) - ROI_MARGIN, 0, [w_img, h_img]).astype(int)
+            x1, y1 = np.clip(np.ceil(pts.max(0)) + ROI_MARGIN + 1, 0, [w_img, h_img]).astype(int)
+            if x1 <= x0 or y1 <= y0: x0, y0, x1, y1 = 0, 0, w_img, h_img
+        factor = round(1 / self.scale) if self.scale < 1 else 1
+        self.interpolation = cv2.INTER_AREA if factor > 1 and abs(factor * self.scale - 1) < 1e-6 else cv2.INTER_LINEAR
+        if self.interpolation == cv2.INTER_AREA:
+            x0, x1 = self._snap(x0, x1, w_img, factor)
+            y0, y1 = self._snap(y0, y1, h_img, factor)
+        self.roi = (int(y0), int(y1), int(x0), int(x1))
+        self.analysis_size = (max(1, round((x1 - x0) * self.scale)), max(1, round((y1 - y0) * self.scale)))
+
+    @staticmethod
+    def _snap(lo, hi, limit, factor):
+        """Grows [lo, hi) to a multiple of `factor` within [0, limit), trimming only if the whole axis is not one."""
+        hi = min(hi + (-(hi - lo)) % factor, limit)
+        lo = max(lo - (-(hi - lo)) % factor, 0)
+        hi -= (hi - lo) % factor
+        return lo, hi
+
+    def to_analysis(self, poly):
+        """Maps a layout polygon (capture-frame pixels) into analysis-image pixels."""
+        y0, _, x0, _ = self.roi
+        return np.round((np.array(poly, np.float64) - (x0, y0)) * self.scale).astype(np.int32)
+
+    def _build(self, store, shape):
+        self._build_roi(store, shape)
+        w_img, h_img = self.analysis_size
+        self.entries = []
+        for poly in store.polygons:
+            pts = self.to_analysis(poly)
+            area = cv2.contourArea(pts)
+            x, y, w, h = cv2.boundingRect(pts)
+            x0, y0, x1, y1 = max(x, 0), max(y, 0), min(x + w, w_img), min(y + h, h_img)
+            if area <= 0 or x1 <= x0 or y1 <= y0:
+                self.entries.append(None); continue
+            mask = np.zeros((y1 - y0, x1 - x0), dtype=np.uint8)
+            cv2.fillPoly(mask, [pts - np.array([x0, y0], np.int32)], 255)
+            self.entries.append((y0, y1, x0, x1, mask, area))
+        self.shape, self.version = shape[:2], store.geometry_version
+
+    def prepare(self, store, shape):
+        if self.version != store.geometry_version or self.shape != shape[:2]: self._build(store, shape)
+
+    def crop(self, img):
+        """The grayscale part of a full frame that analysis looks at, at analysis resolution (call after prepare()).
+        Converting before resizing keeps the resize to one channel."""
+        y0, y1, x0, x1 = self.roi
+        img = cv2.cvtColor(img[y0:y1, x0:x1], cv2.COLOR_BGR2GRAY)
+        if self.scale == 1.0: return img
+        return cv2.resize(img, self.analysis_size, interpolation=self.interpolation)
+
+    def score_cached(self, img_thr, base, only=None):
+        """Scores a thresholded crop() against the masks cached by the last prepare(); needs no access to the
+        store, so it can run without holding the lock. Slots not in `only` keep their flag from `base`."""
+        busy = base.copy()
+        for i in (range(len(self.entries)) if only is None else only):
+            e = self.entries[i]
+            if e is None: busy[i] = False; continue
+            y0, y1, x0, x1, mask, area = e
+            roi = cv2.bitwise_and(img_thr[y0:y1, x0:x1], mask)
+            busy[i] = cv2.countNonZero(roi) / area > BUSY_RATIO_THRESHOLD
+        return busy
+
+occupancy = OccupancyEngine(ANALYSIS_SCALE, ROI_CROP)
+
+class MotionGate:
+    """Cheap frame differencing on a downsampled grayscale frame. changed_slots() lists slots whose bounding box
+    saw motion since the previous tick (or all slots after a geometry change / every MOTION_REFRESH seconds), and
+    interval() picks the fast analysis rate while the scene is active and the slow one once it has been still."""
+    def __init__(self, scale=MOTION_SCALE):
+        self.scale = scale
+        self.prev = self.motion = self.roi = None
+        self.version, self.shape, self.boxes = -1, None, None
+        self.last_full = self.last_motion = 0
+
+    def prepare(self, img, roi=None):
+        """Downsamples `img` (only the analysis ROI (y0, y1, x0, x1) when given) and diffs it against the last one.
+        INTER_NEAREST before the gray conversion is ~15x cheaper than INTER_AREA on the full BGR frame; the small
+        blur takes back the sensor noise that area averaging used to absorb. A new ROI forces a full rescore."""
+        if roi is not None: img = img[roi[0]:roi[1], roi[2]:roi[3]]
+        small = cv2.resize(img, None, fx=self.scale, fy=self.scale, interpolation=cv2.INTER_NEAREST)
+        small = cv2.GaussianBlur(cv2.cvtColor(small, cv2.COLOR_BGR2GRAY), (5, 5), 0)
+        if self.prev is None or self.prev.shape != small.shape or self.roi != roi: self.motion = None
+        else: self.motion = cv2.integral((cv2.absdiff(small, self.prev) > MOTION_PIXEL_DELTA).astype(np.uint8))
+        self.prev, self.roi = small, roi
+
+    def force(self):
+        self.last_full = 0
+
+    def _build_boxes(self, store):
+        h, w = self.prev.shape
+        y_off, _, x_off, _ = self.roi or (0, 0, 0, 0)
+        box = np.array([[min(p[0] for p in poly), min(p[1] for p in poly), max(p[0] for p in poly), max(p[1] for p in poly)]
+                        for poly in store.polygons], np.float64).reshape(-1, 4)
+        box = (box - (x_off, y_off, x_off, y_off)) * self.scale
+        x0, y0 = np.clip(np.floor(box[:, 0]), 0, w).astype(int), np.clip(np.floor(box[:, 1]), 0, h).astype(int)
+        x1, y1 = np.clip(np.ceil(box[:, 2]) + 1, 0, w).astype(int), np.clip(np.ceil(box[:, 3]) + 1, 0, h).astype(int)
+        self.boxes = (x0, y0, x1, y1, (x1 - x0) * (y1 - y0))
+        self.version, self.shape = store.geometry_version, self.prev.shape
+
+    def changed_slots(self, store, curr):
+        if self.motion is None or self.version != store.geometry_version or curr - self.last_full > MOTION_REFRESH:
+            if self.motion is None or self.version != store.geometry_version: self.last_motion = curr
+            self._build_boxes(store)
+            self.last_full = curr
+            return np.arange(len(store))
+        if self.shape != self.prev.shape: self._build_boxes(store)
+        x0, y0, x1, y1, area = self.boxes
+        ii = self.motion
+        moved = ii[y1, x1] - ii[y0, x1] - ii[y1, x0] + ii[y0, x0]
+        changed = np.flatnonzero((area > 0) & (moved > MOTION_SLOT_FRACTION * area))
+        if len(changed): self.last_motion = curr
+        return changed
+
+    def interval(self, curr):
+        return ANALYSIS_FAST_INTERVAL if curr - self.last_motion < MOTION_IDLE_AFTER else ANALYSIS_SLOW_INTERVAL
+
+class StageTimer:
+    """Accumulates wall-clock time per named stage; pass one to analyze_frame()/replay() to profile them."""
+    def __init__(self):
+        self.totals = collections.defaultdict(float)
+        self.counts = collections.defaultdict(int)
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try: yield
+        finally:
+            self.totals[name] += time.perf_counter() - start
+            self.counts[name] += 1
+
+    def mean_ms(self):
+        return {name: 1000 * total / self.counts[name] for name, total in self.totals.items()}
+
+class _NoTimer:
+    def stage(self, name): return contextlib.nullcontext()
+
+NO_TIMER = _NoTimer()
+
+def threshold_frame(img, timer=NO_TIMER):
+    """Adaptive threshold of a BGR or already-grayscale image."""
+    img_gray = img
+    if img.ndim == 3:
+        with timer.stage("grayscale"): img_gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    with timer.stage("blur"): img_blur = cv2.GaussianBlur(img_gray,(3,3),1)
+    with timer.stage("threshold"): return cv2.adaptiveThreshold(img_blur, 255, 0, 1, 25, 10)
+
+def analyze_frame(img, store, engine, timer=NO_TIMER, gate=None, curr=0):
+    """The analysis core: returns one busy flag per slot in `store` for a BGR frame.
+    With a MotionGate, only slots that moved are rescored and a still frame skips thresholding entirely."""
+    only = None
+    engine.prepare(store, img.shape)
+    if gate:
+        with timer.stage("motion"):
+            gate.prepare(img, engine.roi)
+            only = gate.changed_slots(store, curr)
+        if not len(only): return store.busy.copy()
+    with timer.stage("crop"): img = engine.crop(img)
+    img_thr = threshold_frame(img, timer)
+    with timer.stage("scoring"): return engine.score_cached(img_thr, store.busy, only)
+
+def apply_tick(busy_flags, curr, geometry_version=None):
+    """Advances dwell/reservation state for every slot from one round of busy flags. Only the vectorized step
+    runs under `lock`; logging and publishing the snapshot happen after it is released. Returns the captured
+    state, or None if the layout was edited since `geometry_version` was read."""
+    with lock:
+        if geometry_version is not None and geometry_version != slots.geometry_version: return None
+        changed = slots.step(busy_flags, curr)
+        captured = capture_state(curr)
+    log_and_publish(changed, captured)
+    return captured
+
+def log_and_publish(changed, captured):
+    labels = {0: "Slot Freed", 1: "Car Occupied", 2: "Reserved"}
+    for i, st in zip(changed.tolist(), captured.status[changed].tolist()):
+        log_event(i, labels.get(st, "Unknown"), st)
+    publish_state(captured)
+
+def draw_slots(img, polys, statuses, selected=-1, highlight_all=False):
+    for i, poly in enumerate(polys):
+        is_sel = (i == selected or highlight_all)
+        st = statuses[i] if i < len(statuses) else 0
+        color = (255, 255, 255) if is_sel else ((0,255,0) if st==0 else (0,255,255) if st==2 else (0,0,255))
+        cv2.polylines(img, [np.array(poly, np.int32)], True, color, 2)
+        cv2.putText(img, str(i+1), tuple(np.mean(poly, axis=0).astype(int)), 1, 1, color, 2)
+        if i == selected:
+            for pt in poly: cv2.circle(img, tuple(pt), 4, (255, 255, 255), -1)
+
+class OverlayLayer:
+    """Slot outlines and labels pre-rendered into a BGR layer plus mask. render() redraws only when the frame size,
+    geometry version, statuses or selection changed; apply() composites onto a frame with one masked copy, so the
+    per-frame overlay cost no longer grows with the number of slots. Every overlay color has a 255 channel, so the
+    layer's per-pixel max is the coverage of the anti-aliased label edges, which are alpha-blended separately."""
+    def __init__(self):
+        self.key = None
+        self.layer = self.solid = self.edge = None
+
+    def render(self, shape, polys, statuses, geometry_version, selected=-1, highlight_all=False):
+        key = (shape[:2], geometry_version, np.asarray(statuses).tobytes(), selected, highlight_all)
+        if key == self.key: return self
+        layer = self.layer
+        if layer is None or layer.shape[:2] != tuple(shape[:2]): layer = np.zeros((shape[0], shape[1], 3), np.uint8)
+        else: layer.fill(0)  # render() and apply() run on the same thread, so the buffer can be reused
+        draw_slots(layer, polys, statuses, selected, highlight_all)
+        b, g, r = cv2.split(layer)
+        alpha = cv2.max(cv2.max(b, g), r)  # far cheaper than layer.max(axis=2) on a full frame
+        edge = np.flatnonzero(cv2.inRange(alpha, 1, 254))
+        self.edge = (edge, layer.reshape(-1, 3)[edge].astype(np.uint16), (255 - alpha.ravel()[edge]).astype(np.uint16)[:, None])
+        self.layer, self.solid, self.key = layer, cv2.compare(alpha, 255, cv2.CMP_EQ), key
+        return self
+
+    def apply(self, img):
+        """Composites in place onto a contiguous frame of the rendered shape and returns it."""
+        cv2.copyTo(self.layer, self.solid, img)
+        idx, color, keep = self.edge
+        if len(idx):
+            flat = img.reshape(-1, 3)
+            flat[idx] = (flat[idx] * keep + 127) // 255 + color
+        return img
+
+# --- [Live State Feed] ---
+StateSnapshot = collections.namedtuple("StateSnapshot", "version view stats status history")
+SlotCapture = collections.namedtuple("SlotCapture", "seq curr status reserve_time arrived gps cameras")
+
+class StateFeed:
+    """Immutable, versioned snapshots of the public slot view. publish() builds the next snapshot and swaps it in
+    with one reference assignment, so readers use `state_feed.current` without locking. Each snapshot carries a
+    short history of which slots changed, so SSE subscribers and `?since=` pollers only receive deltas.
+    Clients see versions as "<epoch>.<n>" with a random per-process epoch, so a version held from before a restart
+    gets the full snapshot rather than a delta or 304 computed against unrelated history."""
+    DELTA_KEYS = ("id", "status", "remaining", "is_arrived")
+
+    def __init__(self, history=STATE_HISTORY):
+        self.cond = threading.Condition()
+        self.history_len, self.seq = history, 0
+        self.epoch = os.urandom(4).hex()
+        self.current = StateSnapshot(0, (), {}, np.zeros(0, np.int8), ())
+        self.listeners = []  # called from the publishing thread after each new snapshot, e.g. AsyncSignal.notify
+
+    def publish(self, seq, view, stats, status):
+        with self.cond:
+            if seq <= self.seq: return  # a newer capture was already published
+            self.seq, cur = seq, self.current
+            if len(view) != len(cur.view):
+                changed = None  # layout changed: clients need a full snapshot
+            else:
+                changed = tuple(v for old, v in zip(cur.view, view) if old != v)
+                if not changed and stats == cur.stats: return
+            version = cur.version + 1
+            history = (cur.history + ((version, changed),))[-self.history_len:]
+            self.current = StateSnapshot(version, tuple(view), stats, status, history)
+            self.cond.notify_all()
+        for notify in self.listeners: notify()
+
+    def tag(self, version):
+        return f"{self.epoch}.{version}"
+
+    def parse_tag(self, value):
+        """The local version in a client's tag, or None if it is missing, malformed or from another process."""
+        epoch, _, version = (value or "").rpartition(".")
+        return int(version) if epoch == self.epoch and version.isdigit() else None
+
+    def changes_since(self, version, snap):
+        """Slots changed in `snap` since `version`, or None if the client needs a full snapshot."""
+        if version == snap.version: return []
+        if version > snap.version or not snap.history or snap.history[0][0] > version + 1: return None
+        merged = {}
+        for v, changed in snap.history:
+            if v <= version: continue
+            if changed is None: return None
+            for slot in changed: merged[slot["id"]] = {k: slot[k] for k in self.DELTA_KEYS}
+        return list(merged.values())
+
+    def wait(self, version, timeout=None):
+        with self.cond: return self.cond.wait_for(lambda: self.current.version != version, timeout)
+
+state_feed = StateFeed()
+state_seq = itertools.count(1)
 
-slots = load_data()
+def capture_state(curr=None):
+    """Copies the columns the public view is built from. Call with `lock` held; the copies are cheap,
+    building the view is done later by publish_state() without the lock."""
+    return SlotCapture(next(state_seq), curr or time.time(), slots.status.copy(), slots.reserve_time.copy(),
+                       slots.arrived.copy(), list(slots.gps), list(slot_cameras))
+
+def build_slot_view(captured):
+    status = captured.status.tolist()
+    remaining = np.where(captured.status == 2, np.maximum(0, (RESERVE_TIMEOUT - (captured.curr - captured.reserve_time)).astype(int)), 0).tolist()
+    arrived, cameras = captured.arrived.tolist(), captured.cameras
+    return [{"id": i, "status": status[i], "remaining": remaining[i], "is_arrived": arrived[i], "gps": captured.gps[i],
+             "camera": cameras[i] if i < len(cameras) else 0} for i in range(len(status))]
+
+def publish_state(captured):
+    global parking_stats
+    status = captured.status
+    stats = {"free": int((status == 0).sum()), "total": len(status), "reserved": int((status == 2).sum()), "occupied": int((status == 1).sum())}
+    state_feed.publish(captured.seq, build_slot_view(captured), stats, status)
+    parking_stats = state_feed.current.stats
+
+# --- [Reservations] ---
+class ReservationEngine:
+    """Expires reservations at their deadlines from its own thread, independent of the vision loop.
+    Deadlines sit in a min-heap of (deadline, slot, reserve_time); extend/cancel just push or orphan entries,
+    which are skipped when popped because the slot's reserve_time no longer matches."""
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.heap, self.geometry_version = [], -1
+
+    def schedule(self, sid, reserve_time):
+        with self.cond:
+            heapq.heappush(self.heap, (reserve_time + RESERVE_TIMEOUT, sid, reserve_time))
+            self.cond.notify()
+
+    def _rebuild(self):
+        """Slot indices shift when the editor deletes slots; re-derive the heap from the store. Call with `lock` held."""
+        reserved = np.flatnonzero(slots.status == 2)
+        with self.cond:
+            self.heap = [(slots.reserve_time[i] + RESERVE_TIMEOUT, int(i), slots.reserve_time[i]) for i in reserved]
+            heapq.heapify(self.heap)
+        self.geometry_version = slots.geometry_version
+
+    def run(self):
+        while not stop_event.is_set():
+            with self.cond:
+                timeout = min(1.0, self.heap[0][0] - time.time()) if self.heap else 1.0
+                if timeout > 0: self.cond.wait(timeout)
+                now, due = time.time(), []
+                while self.heap and self.heap[0][0] <= now: due.append(heapq.heappop(self.heap))
+                active = bool(self.heap)
+            with lock:
+                if self.geometry_version != slots.geometry_version: self._rebuild()
+                for _, sid, reserve_time in due:
+                    if sid < len(slots) and slots.status[sid] == 2 and slots.reserve_time[sid] == reserve_time:
+                        slots[sid].reset()
+                if not (due or active): continue
+                changed, captured = slots.take_changes(), capture_state(now)
+            log_and_publish(changed, captured)  # also refreshes "remaining" once a second while holds are active
+
+reservations = ReservationEngine()
+
+RESERVATION_OPS = {"reserve": ({0}, 2), "extend": ({2}, 2), "cancel": (None, 0)}  # op -> (allowed from, result)
+
+def run_reservation_ops(ops, all_or_nothing=False):
+    """Applies [(op, slot_id), ...] in order under one short lock hold. Returns (per-op error or None, applied)."""
+    now = time.time()
+    with lock:
+        pending, errors = {}, []
+        for op, sid in ops:
+            if not isinstance(op, str) or op not in RESERVATION_OPS: errors.append("unknown op"); continue
+            if not isinstance(sid, int) or not 0 <= sid < len(slots): errors.append("no such slot"); continue
+            allowed, result = RESERVATION_OPS[op]
+            status = pending.get(sid, int(slots.status[sid]))
+            if allowed is not None and status not in allowed:
+                errors.append("slot not free" if op == "reserve" else "slot not reserved"); continue
+            pending[sid] = result
+            errors.append(None)
+        applied = not all_or_nothing or not any(errors)
+        if applied:
+            for (op, sid), err in zip(ops, errors):
+                if err: continue
+                slot = slots[sid]
+                if op == "reserve": slot.status, slot.reserve_time, slot.dwell_start, slot.arrived = 2, now, 0, False
+                elif op == "extend": slot.reserve_time = now
+                else: slot.reset()
+                if op != "cancel": reservations.schedule(sid, now)
+        changed, captured = slots.take_changes(), capture_state(now)
+    log_and_publish(changed, captured)
+    return errors, applied
+
+# --- [Offline Replay] ---
+def iter_frames(source):
+    """Yields BGR frames from a list/array of frames, an image directory, a glob pattern or a video file."""
+    if isinstance(source, (list, tuple, np.ndarray)):
+        yield from source; return
+    if os.path.isdir(source) or any(c in source for c in "*?["):
+        pattern = os.path.join(source, "*") if os.path.isdir(source) else source
+        for path in sorted(glob.glob(pattern)):
+            img = cv2.imread(path)
+            if img is not None: yield img
+        return
+    capture = cv2.VideoCapture(source)
+    try:
+        while True:
+            success, img = capture.read()
+            if not success: break
+            yield img
+    finally:
+        capture.release()
+
+def replay(source, store, fps=10.0, analyze_every=1, overlay=False, encode=False, timer=NO_TIMER, on_frame=None, max_frames=None, motion_gate=False,
+           analysis_scale=1.0, roi_crop=True, stream_size=None):
+    """Drives the analysis core over recorded frames as fast as possible with no camera, GUI or web server.
+    Slot state advances on a simulated clock of `fps` frames per second so dwell timing is reproducible.
+    Returns (frames processed, elapsed seconds)."""
+    engine, gate, n, start = OccupancyEngine(analysis_scale, roi_crop), MotionGate() if motion_gate else None, 0, time.perf_counter()
+    overlay_layer = OverlayLayer()
+    for img in iter_frames(source):
+        if n % analyze_every == 0:
+            curr = (n + 1) / fps  # never 0: step() reads dwell_start == 0 as "no dwell"
+            busy = analyze_frame(img, store, engine, timer, gate, curr)
+            with timer.stage("state"): store.step(busy, curr)
+        if overlay or encode:
+            with timer.stage("overlay"):
+                img = overlay_layer.render(img.shape, store.polygons, store.status, store.geometry_version).apply(img.copy())
+        if encode:
+            with timer.stage("encode"): cv2.imencode('.jpg', stream_frame(img, stream_size), [cv2.IMWRITE_JPEG_QUALITY, 80])
+        if on_frame: on_frame(n, store)
+        n += 1
+        if max_frames and n >= max_frames: break
+    return n, time.perf_counter() - start
+
+# --- [Frame Broadcast] ---
+class FrameHub:
+    """Latest encoded frame plus a version number. Subscribers sleep on a condition until a newer
+    version is published, so slow clients simply skip to the newest frame."""
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.frame, self.version, self.subscribers = None, 0, 0
+        self.listeners = []
+
+    def has_subscribers(self):
+        return self.subscribers > 0
+
+    def publish(self, frame):
+        with self.cond:
+            self.frame, self.version = frame, self.version + 1
+            self.cond.notify_all()
+        for notify in self.listeners: notify()
+
+    def stream(self, max_fps=STREAM_MAX_FPS):
+        with self.cond: self.subscribers += 1
+        try:
+            version, min_gap, last_sent = 0, 1.0 / max_fps if max_fps > 0 else 0, 0
+            while not stop_event.is_set():
+                if min_gap: time.sleep(max(0, last_sent + min_gap - time.monotonic()))
+                with self.cond:
+                    if not self.cond.wait_for(lambda: self.version != version, timeout=5): continue
+                    version, frame = self.version, self.frame
+                last_sent = time.monotonic()
+                yield frame
+        finally:
+            with self.cond: self.subscribers -= 1
+
+frame_hubs = {0: FrameHub()}
+
+# --- [Multi-Camera] ---
+class CameraChannel:
+    """Shared-memory block for one camera: header (frame seq, frame length, analysis seq, watcher flag), busy flags
+    written by the worker, statuses written back by the parent for the overlay, and the latest JPEG frame."""
+    HEADER = 32
+
+    def __init__(self, n_slots, name=None, frame_bytes=FRAME_SHM_BYTES):
+        size = self.HEADER + 2 * n_slots + frame_bytes
+        self.shm = shared_memory.SharedMemory(name=name, create=name is None, size=size)
+        buf = self.shm.buf
+        self.header = np.ndarray((4,), np.uint64, buf, 0)
+        self.busy = np.ndarray((n_slots,), np.uint8, buf, self.HEADER)
+        self.status = np.ndarray((n_slots,), np.uint8, buf, self.HEADER + n_slots)
+        self.frame = np.ndarray((frame_bytes,), np.uint8, buf, self.HEADER + 2 * n_slots)
+        if name is None: self.header[:] = 0
+
+    def close(self):
+        del self.header, self.busy, self.status, self.frame
+        self.shm.close()
+
+def camera_worker(source, layout_file, shm_name, n_slots, frame_bytes, shm_lock, stop_event, motion_gate=True,
+                  capture_size=CAPTURE_SIZE, analysis_scale=ANALYSIS_SCALE, roi_crop=ROI_CROP, stream_size=STREAM_SIZE):
+    channel = CameraChannel(n_slots, name=shm_name, frame_bytes=frame_bytes)
+    store = SlotStore.from_rows(load_data(layout_file)[:n_slots])
+    engine, gate = OccupancyEngine(analysis_scale, roi_crop), MotionGate() if motion_gate else None
+    overlay_layer = OverlayLayer()
+    source = parse_source(source)
+    capture = open_capture(source, capture_size)
+    is_file = isinstance(source, str) and os.path.isfile(source)
+    frame_delay = 1.0 / (capture.get(cv2.CAP_PROP_FPS) or 25) if is_file else 0
+    last_analysis, interval = 0, ANALYSIS_INTERVAL
+    try:
+        while not stop_event.is_set():
+            success, img = capture.read()
+            if not success:
+                if is_file: capture.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                time.sleep(0.01); continue
+            curr = time.time()
+            if curr - last_analysis > interval:
+                store.busy[:] = busy = analyze_frame(img, store, engine, gate=gate, curr=curr)
+                with shm_lock:
+                    channel.busy[:] = busy
+                    channel.header[2] += 1
+                last_analysis = curr
+                if gate: interval = gate.interval(curr)
+            with shm_lock: statuses, watched = channel.status.copy(), channel.header[3] > 0
+            if watched:
+                overlay_layer.render(img.shape, store.polygons, statuses, store.geometry_version).apply(img)
+                _, buf = cv2.imencode('.jpg', stream_frame(img, stream_size), [cv2.IMWRITE_JPEG_QUALITY, 80])
+                if buf.size <= frame_bytes:
+                    with shm_lock:
+                        channel.frame[:buf.size] = buf.ravel()
+                        channel.header[1] = buf.size
+                        channel.header[0] += 1
+            if frame_delay: time.sleep(max(0, frame_delay - (time.time() - curr)))
+    finally:
+        capture.release()
+        channel.close()
+
+class CameraPool:
+    """Runs one capture+analysis worker process per camera. `config` is a list of
+    {"source": <device index | RTSP URL | video file>, "layout": <slot layout json>, "size": optional "WxH" capture size}."""
+    def __init__(self, config):
+        ctx = mp.get_context("spawn")
+        self.stop_event = ctx.Event()
+        self.cameras = []
+        self.layout, self.slot_cameras = [], []
+        for cam_id, cam in enumerate(config):
+            layout = load_data(cam["layout"])
+            channel = CameraChannel(len(layout))
+            shm_lock = ctx.Lock()
+            proc = ctx.Process(target=camera_worker, daemon=True,
+                               args=(cam["source"], cam["layout"], channel.shm.name, len(layout), FRAME_SHM_BYTES, shm_lock, self.stop_event, MOTION_GATE,
+                                     parse_size(cam["size"]) if "size" in cam else CAPTURE_SIZE, ANALYSIS_SCALE, ROI_CROP, STREAM_SIZE))
+            self.cameras.append((channel, shm_lock, proc, len(self.layout), len(layout)))
+            self.layout += layout
+            self.slot_cameras += [cam_id] * len(layout)
+            frame_hubs.setdefault(cam_id, FrameHub())
+
+    def start(self):
+        for _, _, proc, _, _ in self.cameras: proc.start()
+        threading.Thread(target=self.relay_frames, daemon=True).start()
+
+    def read_busy(self):
+        busy = np.zeros(len(self.layout), dtype=bool)
+        for channel, shm_lock, _, start, n in self.cameras:
+            with shm_lock: busy[start:start + n] = channel.busy
+        return busy
+
+    def write_status(self, statuses):
+        for channel, shm_lock, _, start, n in self.cameras:
+            with shm_lock: channel.status[:] = statuses[start:start + n]
+
+    def relay_frames(self):
+        """Copies each camera's newest JPEG out of shared memory into its FrameHub, only while someone is watching."""
+        seen = [0] * len(self.cameras)
+        while not self.stop_event.is_set():
+            for cam_id, (channel, shm_lock, _, _, _) in enumerate(self.cameras):
+                hub = frame_hubs[cam_id]
+                with shm_lock:
+                    channel.header[3] = 1 if hub.has_subscribers() else 0
+                    seq, size = int(channel.header[0]), int(channel.header[1])
+                    frame = channel.frame[:size].tobytes() if seq != seen[cam_id] and size else None
+                if frame:
+                    seen[cam_id] = seq
+                    hub.publish(frame)
+            time.sleep(0.01)
+
+    def stop(self):
+        self.stop_event.set()
+        for channel, _, proc, _, _ in self.cameras:
+            proc.join(timeout=2)
+            if proc.is_alive(): proc.terminate()
+            channel.close(); channel.shm.unlink()
+
+def multi_camera_process():
+    while True:
+        time.sleep(ANALYSIS_INTERVAL)
+        captured = apply_tick(camera_pool.read_busy(), time.time())
+        camera_pool.write_status(captured.status)
 
 # --- [Mouse Logic] ---
 def mouse_events(event, x, y, flags, param):
-    global slots, temp_points, selected_slot, selected_point, is_dragging, last_mouse_pos, mouse_curr
+    global temp_points, selected_slot, selected_point, is_dragging, last_mouse_pos, mouse_curr
     mouse_curr = (x, y)
-    
-    if event == cv2.EVENT_RBUTTONDOWN: 
-        temp_points.append([x, y])
-        if len(temp_points) == 4:
-            slots.append([temp_points, 0, 0, 0, False, "18.573077155796554,99.00090305034648", False])
-            temp_points = []; save_data(slots)
+    with lock:
+        if event == cv2.EVENT_RBUTTONDOWN: 
+            temp_points.append([x, y])
+            if len(temp_points) == 4:
+                before = slots.geometry_version
+                slots.append(temp_points); slot_index.slot_changed(slots, len(slots) - 1, before)
+                temp_points = []; layout_saver.request()
             
-    elif event == cv2.EVENT_LBUTTONDOWN:
-        is_dragging, last_mouse_pos = True, (x, y)
-        selected_slot, selected_point = -1, -1
-        for i, s in enumerate(slots):
-            for j, pt in enumerate(s[0]):
-                if np.linalg.norm(np.array(pt) - np.array([x, y])) < 12:
-                    selected_slot, selected_point = i, j; return
-        for i, s in enumerate(slots):
-            if cv2.pointPolygonTest(np.array(s[0], np.int32), (x, y), False) >= 0:
-                selected_slot = i; break
+        elif event == cv2.EVENT_LBUTTONDOWN:
+            is_dragging, last_mouse_pos = True, (x, y)
+            selected_slot, selected_point = -1, -1
+            hit = slot_index.vertex_at(slots, x, y)
+            if hit: selected_slot, selected_point = hit; return
+            selected_slot = slot_index.polygon_at(slots, x, y)
                 
-    elif event == cv2.EVENT_MOUSEMOVE and is_dragging:
-        dx, dy = x - last_mouse_pos[0], y - last_mouse_pos[1]
-        if move_all_mode:
-            for s in slots:
-                for pt in s[0]: pt[0] += dx; pt[1] += dy
-        elif selected_slot != -1:
-            target_slot = slots[selected_slot]
-            is_sym = target_slot[6] if len(target_slot) > 6 else False
-            if selected_point != -1:
-                if is_sym:
-                    pts = np.array(target_slot[0])
-                    center = np.mean(pts, axis=0)
-                    dist_x = pts[selected_point][0] - center[0]
-                    dist_y = pts[selected_point][1] - center[1]
-                    scale_x = 1 + (dx / dist_x) if abs(dist_x) > 1 else 1
-                    scale_y = 1 + (dy / dist_y) if abs(dist_y) > 1 else 1
-                    for i in range(4):
-                        pts[i][0] = int(center[0] + (pts[i][0] - center[0]) * scale_x)
-                        pts[i][1] = int(center[1] + (pts[i][1] - center[1]) * scale_y)
-                    slots[selected_slot][0] = pts.tolist()
-                else:
-                    slots[selected_slot][0][selected_point][0] += dx
-                    slots[selected_slot][0][selected_point][1] += dy
-            else: 
-                for pt in target_slot[0]: pt[0] += dx; pt[1] += dy
-        last_mouse_pos = (x, y)
+        elif event == cv2.EVENT_MOUSEMOVE and is_dragging:
+            dx, dy = x - last_mouse_pos[0], y - last_mouse_pos[1]
+            before = slots.geometry_version
+            if move_all_mode:
+                for poly in slots.polygons:
+                    for pt in poly: pt[0] += dx; pt[1] += dy
+            elif selected_slot != -1:
+                target_slot = slots[selected_slot]
+                if selected_point != -1:
+                    if target_slot.symmetric:
+                        pts = np.array(target_slot.polygon)
+                        center = np.mean(pts, axis=0)
+                        dist_x = pts[selected_point][0] - center[0]
+                        dist_y = pts[selected_point][1] - center[1]
+                        scale_x = 1 + (dx / dist_x) if abs(dist_x) > 1 else 1
+                        scale_y = 1 + (dy / dist_y) if abs(dist_y) > 1 else 1
+                        for i in range(4):
+                            pts[i][0] = int(center[0] + (pts[i][0] - center[0]) * scale_x)
+                            pts[i][1] = int(center[1] + (pts[i][1] - center[1]) * scale_y)
+                        target_slot.polygon = pts.tolist()
+                    else:
+                        target_slot.polygon[selected_point][0] += dx
+                        target_slot.polygon[selected_point][1] += dy
+                else: 
+                    for pt in target_slot.polygon: pt[0] += dx; pt[1] += dy
+            if move_all_mode or selected_slot != -1: slots.geometry_changed()
+            if not move_all_mode and selected_slot != -1: slot_index.slot_changed(slots, selected_slot, before)
+            last_mouse_pos = (x, y)
         
-    elif event == cv2.EVENT_LBUTTONUP:
-        if is_dragging: save_data(slots)
-        is_dragging = False
+        elif event == cv2.EVENT_LBUTTONUP:
+            if is_dragging and (move_all_mode or selected_slot != -1): layout_saver.request()
+            is_dragging = False
+
+# --- [Pipeline] ---
+class FrameQueue:
+    """Bounded hand-off between pipeline stages. When full, policy "latest" drops the oldest item
+    (latest-frame-wins), "drop_new" discards the incoming item and "block" waits for space."""
+    def __init__(self, maxsize=PIPELINE_QUEUE_SIZE, policy=DROP_POLICY):
+        self.items = collections.deque()
+        self.maxsize, self.policy = max(1, maxsize), policy
+        self.cond = threading.Condition()
+        self.dropped = 0
+
+    def put(self, item):
+        with self.cond:
+            if len(self.items) >= self.maxsize:
+                if self.policy == "drop_new":
+                    self.dropped += 1; return False
+                if self.policy == "block":
+                    while len(self.items) >= self.maxsize and not stop_event.is_set(): self.cond.wait(0.5)
+                else:
+                    self.items.popleft(); self.dropped += 1
+            self.items.append(item)
+            self.cond.notify_all()
+            return True
+
+    def get(self, timeout=None, latest=False):
+        with self.cond:
+            if not self.items: self.cond.wait_for(lambda: self.items, timeout)
+            if not self.items: return None
+            item = self.items[-1] if latest else self.items[0]
+            if latest: self.items.clear()
+            else: self.items.popleft()
+            self.cond.notify_all()
+            return item
+
+def capture_loop(outputs):
+    window_start, window_frames = time.monotonic(), 0
+    while not stop_event.is_set():
+        success, img = cap.read()
+        if not success:
+            metrics.inc("parking_capture_failures_total")
+            time.sleep(0.01); continue
+        metrics.inc("parking_frames_captured_total")
+        window_frames += 1
+        if time.monotonic() - window_start >= 1:
+            metrics.set("parking_capture_fps", round(window_frames / (time.monotonic() - window_start), 2))
+            window_start, window_frames = time.monotonic(), 0
+        for q in outputs: q.put(img)
+
+def analysis_loop(frames):
+    gate = MotionGate() if MOTION_GATE else None
+    while not stop_event.is_set():
+        img = frames.get(timeout=0.5, latest=True)
+        if img is None: continue
+        curr, tick_start = time.time(), time.perf_counter()
+        only = None
+        if gate:
+            with analysis_timer.stage("motion"): gate.prepare(img, occupancy.roi)  # last tick's ROI; a change rescores all
+        with lock:
+            version, base = slots.geometry_version, slots.busy.copy()
+            if gate: only = gate.changed_slots(slots, curr)
+            if only is None or len(only): occupancy.prepare(slots, img.shape)
+        if only is None or len(only):
+            with analysis_timer.stage("crop"): img = occupancy.crop(img)
+            img_thr = threshold_frame(img, analysis_timer)
+            with analysis_timer.stage("scoring"): busy_flags = occupancy.score_cached(img_thr, base, only)
+        else:
+            busy_flags = base
+        with analysis_timer.stage("state"):
+            if apply_tick(busy_flags, curr, version) is None and gate: gate.force()  # layout edited mid-tick
+        metrics.observe("parking_analysis_tick_seconds", time.perf_counter() - tick_start)
+        interval = gate.interval(curr) if gate else ANALYSIS_INTERVAL
+        time.sleep(max(0, interval - (time.time() - curr)))
+
+def encode_loop(frames, overlay=STREAM_OVERLAY):
+    """JPEG-encodes frames for /video_feed. With overlay "public" the frames arrive clean and get the status-only
+    layer here; "editor" and "none" frames are encoded as they come."""
+    hub, layer = frame_hubs[0], OverlayLayer() if overlay == "public" else None
+    polys, poly_version = [], -1
+    while not stop_event.is_set():
+        img = frames.get(timeout=0.5, latest=True)
+        if img is None or not hub.has_subscribers(): continue
+        start = time.perf_counter()
+        if layer:
+            if poly_version != slots.geometry_version:  # the lock only covers copying the edited geometry
+                with lock: poly_version, polys = slots.geometry_version, copy.deepcopy(slots.polygons)
+            img = layer.render(img.shape, polys, state_feed.current.status, poly_version).apply(img.copy())
+        _, buf = cv2.imencode('.jpg', stream_frame(img, STREAM_SIZE), [cv2.IMWRITE_JPEG_QUALITY, 80])
+        metrics.observe("parking_jpeg_encode_seconds", time.perf_counter() - start)
+        metrics.observe("parking_jpeg_bytes", buf.size)
+        hub.publish(buf.tobytes())
 
 # --- [วิเคราะห์วิดีโอ & คีย์บอร์ด] ---
-def main_process():
-    global slots, encoded_frame, parking_stats, selected_slot, move_all_mode, last_status, copied_slot_data
+def main_process(queue_size=PIPELINE_QUEUE_SIZE, drop_policy=DROP_POLICY, stream_overlay=STREAM_OVERLAY):
+    analysis_q, render_q, encode_q = (FrameQueue(queue_size, drop_policy) for _ in range(3))
+    queues = {"analysis": analysis_q, "render": render_q, "encode": encode_q}
+    metrics.collector("parking_frames_dropped_total", "counter", "Frames dropped by a full pipeline queue",
+                      lambda: [({"queue": name}, q.dropped) for name, q in queues.items()])
+    stream_window = stream_overlay == "editor"  # otherwise the encoder gets clean frames straight from capture
+    threading.Thread(target=capture_loop, args=((analysis_q, render_q) if stream_window else (analysis_q, render_q, encode_q),), daemon=True).start()
+    threading.Thread(target=analysis_loop, args=(analysis_q,), daemon=True).start()
+    threading.Thread(target=encode_loop, args=(encode_q, stream_overlay), daemon=True).start()
+    editor_layer = OverlayLayer()
     cv2.namedWindow("Setup")
     cv2.setMouseCallback("Setup", mouse_events)
-    last_analysis = 0
+    published_geometry = -1
 
-    while True:
-        success, img = cap.read()
-        if not success: continue
-        img_display, curr = img.copy(), time.time()
-
-        if curr - last_analysis > 0.5:
-            img_gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-            img_thr = cv2.adaptiveThreshold(cv2.GaussianBlur(img_gray,(3,3),1), 255, 0, 1, 25, 10)
-            f_count, r_count, o_count = 0, 0, 0
-            
-            with lock:
-                if not last_status: last_status = [s[1] for s in slots]
-                while len(last_status) < len(slots): last_status.append(0)
-
-                for i, s in enumerate(slots):
-                    pts = np.array(s[0], np.int32)
-                    mask = np.zeros(img_thr.shape, dtype=np.uint8)
-                    cv2.fillPoly(mask, [pts], 255)
-                    area = cv2.contourArea(pts)
-                    busy = (cv2.countNonZero(cv2.bitwise_and(img_thr, mask))/area > BUSY_RATIO_THRESHOLD) if area>0 else False
-                    if busy:
-                        if s[3] == 0: slots[i][3] = curr
-                        dwell = curr - s[3]
-                    else: 
-                        slots[i][3] = 0
-                        dwell = 0
-                    
-                    if s[1] == 2: 
-                        r_count += 1
-                        slots[i][4] = True if dwell > OCCUPY_DELAY else False
-                        if (curr - s[2]) > RESERVE_TIMEOUT: 
-                            slots[i][1], slots[i][2], slots[i][3], slots[i][4] = 0, 0, 0, False
-                    else:
-                        if dwell > OCCUPY_DELAY: 
-                            slots[i][1] = 1; o_count += 1
-                        else: 
-                            slots[i][1] = 0; f_count += 1
-                    
-                    if i < len(last_status) and slots[i][1] != last_status[i]:
-                        labels = {0: "Slot Freed", 1: "Car Occupied", 2: "Reserved"}
-                        log_event(i, labels.get(slots[i][1], "Unknown"), slots[i][1])
-                        last_status[i] = slots[i][1]
-
-                parking_stats.update({"free": f_count, "total": len(slots), "reserved": r_count, "occupied": o_count})
-            last_analysis = curr
-
-        for i, s in enumerate(slots):
-            is_sel = (i == selected_slot or move_all_mode)
-            color = (255, 255, 255) if is_sel else ((0,255,0) if s[1]==0 else (0,255,255) if s[1]==2 else (0,0,255))
-            cv2.polylines(img_display, [np.array(s[0], np.int32)], True, color, 2)
-            cv2.putText(img_display, str(i+1), tuple(np.mean(s[0], axis=0).astype(int)), 1, 1, color, 2)
-            if i == selected_slot:
-                for pt in s[0]: cv2.circle(img_display, tuple(pt), 4, (255, 255, 255), -1)
-        
-        _, buf = cv2.imencode('.jpg', img_display, [cv2.IMWRITE_JPEG_QUALITY, 80]) 
-        with lock: encoded_frame = buf.tobytes()
-        cv2.imshow("Setup", img_display)
+    while not stop_event.is_set():
+        img = render_q.get(timeout=0.05)
+        if img is not None:
+            # geometry is only ever edited on this thread, so the polygons can be read without the lock
+            img_display, status = img.copy(), state_feed.current.status
+            if is_dragging and (move_all_mode or selected_slot != -1):
+                draw_slots(img_display, slots.polygons, status, selected_slot, move_all_mode)  # geometry changes every move
+            else:
+                editor_layer.render(img.shape, slots.polygons, status, slots.geometry_version, selected_slot, move_all_mode).apply(img_display)
+            if stream_window: encode_q.put(img_display)
+            cv2.imshow("Setup", img_display)
         
         key = cv2.waitKey(1) & 0xFF
-        if key == ord('q'): break
-        elif key == ord('m'): move_all_mode = not move_all_mode
-        elif key == ord('z'):
+        if key == ord('q'): stop_event.set(); break
+        if key != 0xFF:
+            with lock: handle_editor_key(key)
+        if published_geometry != slots.geometry_version:
+            with lock: published_geometry, captured = slots.geometry_version, capture_state()
+            publish_state(captured)
+
+def handle_editor_key(key):
+    global selected_slot, move_all_mode, copied_slot_data
+    if key == ord('m'): move_all_mode = not move_all_mode
+    elif key == ord('z'):
+        mx, my = mouse_curr
+        before = slots.geometry_version
+        slots.append([ [mx-40, my-25], [mx+40, my-25], [mx+40, my+25], [mx-40, my+25] ], symmetric=True)
+        slot_index.slot_changed(slots, len(slots) - 1, before); layout_saver.request()
+    elif key == ord('x'):
+        if selected_slot != -1:
+            slots.pop(selected_slot)
+            selected_slot = -1; layout_saver.request()
+    elif key == ord('c'):
+        if selected_slot != -1: copied_slot_data = (copy.deepcopy(slots[selected_slot].polygon), slots[selected_slot].symmetric)
+    elif key == ord('v'):
+        if copied_slot_data:
             mx, my = mouse_curr
-            slots.append([[ [mx-40, my-25], [mx+40, my-25], [mx+40, my+25], [mx-40, my+25] ], 0, 0, 0, False, "18.573077155796554,99.00090305034648", True])
-            last_status.append(0); save_data(slots)
-        elif key == ord('x'):
-            if selected_slot != -1:
-                slots.pop(selected_slot); last_status.pop(selected_slot)
-                selected_slot = -1; save_data(slots)
-        elif key == ord('c'):
-            if selected_slot != -1: copied_slot_data = copy.deepcopy(slots[selected_slot])
-        elif key == ord('v'):
-            if copied_slot_data:
-                mx, my = mouse_curr
-                pts = np.array(copied_slot_data[0])
-                offset = np.array([mx, my]) - np.mean(pts, axis=0)
-                new_pts = (pts + offset).astype(int).tolist()
-                is_sym = copied_slot_data[6] if len(copied_slot_data) > 6 else False
-                slots.append([new_pts, 0, 0, 0, False, "18.573077155796554,99.00090305034648", is_sym])
-                last_status.append(0); save_data(slots)
-        elif key == ord('k'):
-            slots = []; last_status = []; selected_slot = -1; save_data(slots)
+            pts = np.array(copied_slot_data[0])
+            offset = np.array([mx, my]) - np.mean(pts, axis=0)
+            new_pts = (pts + offset).astype(int).tolist()
+            before = slots.geometry_version
+            slots.append(new_pts, symmetric=copied_slot_data[1])
+            slot_index.slot_changed(slots, len(slots) - 1, before); layout_saver.request()
+    elif key == ord('k'):
+        slots.clear(); selected_slot = -1; layout_saver.request()
 
 # --- [API Routes] ---
 @app.route('/api/hourly_stats')
 def get_hourly_stats():
-    today_stats = [0] * 24
-    history_data = {} 
-    today_str = datetime.now().strftime("%Y-%m-%d")
-    if os.path.exists(LOG_FILE):
-        with open(LOG_FILE, mode='r', encoding='utf-8') as f:
-            reader = csv.reader(f)
-            next(reader, None)
-            for row in reader:
-                if len(row) < 3: continue
-                try:
-                    dt = datetime.strptime(row[0].strip(), "%Y-%m-%d %H:%M:%S")
-                    d_key = dt.strftime("%Y-%m-%d")
-                    if row[2].strip() == "Car Occupied":
-                        if d_key == today_str: today_stats[dt.hour] += 1
-                        if d_key not in history_data: history_data[d_key] = [0] * 24
-                        history_data[d_key][dt.hour] += 1
-                except: continue
-    avg_stats = [round(sum(d[h] for d in history_data.values())/len(history_data),1) if history_data else 0 for h in range(24)]
+    today_stats, avg_stats = rollup.query()
     return jsonify({"today": today_stats, "average": avg_stats})
 
+@app.route('/api/hourly_stats/rebuild', methods=['POST'])
+def rebuild_hourly_stats():
+    event_writer.rebuild_rollup()
+    return jsonify({"status": "success"})
+
+def all_data_payload(snap, since, etag_matches):
+    """Body for GET /api/all_data (shared by the Flask and asyncio servers): None for 304 Not Modified,
+    the slots changed since the `since` tag when the history still covers it, else the full snapshot."""
+    since, tag = state_feed.parse_tag(since), state_feed.tag(snap.version)
+    if since == snap.version or etag_matches(tag): return None
+    if since is not None and (changed := state_feed.changes_since(since, snap)) is not None:
+        return {"version": tag, "stats": snap.stats, "slots": changed, "delta": True}
+    return {"version": tag, "stats": snap.stats, "slots": snap.view}
+
 @app.route('/api/all_data')
 def get_all_data():
-    curr = time.time()
-    with lock:
-        res = [{"id": i, "status": s[1], "remaining": max(0, int(RESERVE_TIMEOUT - (curr - s[2]))) if s[1] == 2 else 0, "is_arrived": s[4], "gps": s[5]} for i, s in enumerate(slots)]
-    return jsonify({"stats": parking_stats, "slots": res})
+    snap = state_feed.current
+    payload = all_data_payload(snap, request.args.get('since'), request.if_none_match.contains)
+    resp = Response(status=304) if payload is None else jsonify(payload)
+    resp.set_etag(state_feed.tag(snap.version))
+    return resp
+
+def sse_event(name, data):
+    return f"event: {name}\ndata: {json.dumps(data)}\n\n"
+
+def state_event(snap, since=None):
+    """SSE message bringing a client at version `since` (None: a new client) up to `snap`."""
+    changed, tag = None if since is None else state_feed.changes_since(since, snap), state_feed.tag(snap.version)
+    if changed is None: return sse_event("snapshot", {"version": tag, "stats": snap.stats, "slots": snap.view})
+    return sse_event("delta", {"version": tag, "stats": snap.stats, "slots": changed, "delta": True})
+
+@app.route('/api/stream')
+def stream_state():
+    def gen():
+        snap = state_feed.current
+        yield state_event(snap)
+        while not stop_event.is_set():
+            if not state_feed.wait(snap.version, timeout=15):
+                yield ": keepalive\n\n"; continue
+            prev, snap = snap, state_feed.current
+            yield state_event(snap, prev.version)
+    return Response(gen(), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+def parse_slot_id(value):
+    """A JSON integer or digit string (the dashboard sends ids from localStorage); anything else, such as
+    true or 1.9, is None and reported as "no such slot" instead of being coerced to a real slot."""
+    if isinstance(value, int) and not isinstance(value, bool): return value
+    if isinstance(value, str) and value.strip().isdigit(): return int(value)
+    return None
+
+def single_reservation_op(op):
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict): return jsonify({"status": "error", "reason": "body must be a JSON object"}), 400
+    errors, _ = run_reservation_ops([(op, parse_slot_id(body.get('slot_id')))])
+    if errors[0]: return jsonify({"status": "error"}), 400
+    return jsonify({"status": "success"})
 
 @app.route('/api/reserve', methods=['POST'])
 def reserve_slot():
-    sid = int(request.json.get('slot_id'))
-    with lock:
-        if 0 <= sid < len(slots) and slots[sid][1] == 0:
-            slots[sid][1], slots[sid][2], slots[sid][3], slots[sid][4] = 2, time.time(), 0, False
-            return jsonify({"status": "success"})
-    return jsonify({"status": "error"}), 400
+    return single_reservation_op("reserve")
 
 @app.route('/api/extend', methods=['POST'])
 def extend_slot():
-    sid = int(request.json.get('slot_id'))
-    with lock:
-        if 0 <= sid < len(slots) and slots[sid][1] == 2:
-            slots[sid][2] = time.time() 
-            return jsonify({"status": "success"})
-    return jsonify({"status": "error"}), 400
+    return single_reservation_op("extend")
 
 @app.route('/api/cancel', methods=['POST'])
 def cancel_slot():
-    sid = int(request.json.get('slot_id'))
-    with lock:
-        if 0 <= sid < len(slots):
-            slots[sid][1], slots[sid][2], slots[sid][3], slots[sid][4] = 0, 0, 0, False
-            return jsonify({"status": "success"})
-    return jsonify({"status": "error"}), 400
+    return single_reservation_op("cancel")
+
+@app.route('/api/batch', methods=['POST'])
+def batch_reservations():
+    """{"ops": [{"op": "reserve"|"extend"|"cancel", "slot_id": n}, ...], "all_or_nothing": false}"""
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict): return jsonify({"status": "error", "reason": "body must be a JSON object"}), 400
+    raw = body.get("ops")
+    if not isinstance(raw, list) or not raw or len(raw) > MAX_BATCH_OPS:
+        return jsonify({"status": "error", "reason": f"ops must be a list of 1-{MAX_BATCH_OPS} operations"}), 400
+    ops = [(o.get("op"), parse_slot_id(o.get("slot_id"))) if isinstance(o, dict) else (None, None) for o in raw]
+    errors, applied = run_reservation_ops(ops, bool(body.get("all_or_nothing")))
+    results = [{"op": op, "slot_id": sid, "status": "error" if err else ("success" if applied else "skipped"), **({"reason": err} if err else {})}
+               for (op, sid), err in zip(ops, errors)]
+    status = "success" if not any(errors) else ("partial" if applied and not all(errors) else "error")
+    return jsonify({"status": status, "applied": applied, "results": results}), 200 if applied else 409
+
+def feed_params(cam_id, max_fps):
+    """(camera id or None if there is no such camera, fps clamped to (0, STREAM_MAX_FPS]) for /video_feed."""
+    if cam_id < 0 or cam_id >= (len(camera_pool.cameras) if camera_pool else 1): cam_id = None
+    return cam_id, max_fps if 0 < max_fps <= STREAM_MAX_FPS else STREAM_MAX_FPS
 
 @app.route('/video_feed')
 def video_feed():
+    cam_id, max_fps = feed_params(request.args.get('cam', 0, type=int), request.args.get('fps', STREAM_MAX_FPS, type=float))
+    if cam_id is None: return jsonify({"status": "error"}), 404
     def gen():
-        while True:
-            time.sleep(0.05)
-            with lock:
-                if encoded_frame: yield (b'--frame\r\nContent-Type: image/jpeg\r\n\r\n' + encoded_frame + b'\r\n')
+        for frame in frame_hubs[cam_id].stream(max_fps):
+            yield (b'--frame\r\nContent-Type: image/jpeg\r\n\r\n' + frame + b'\r\n')
     return Response(gen(), mimetype='multipart/x-mixed-replace; boundary=frame')
 
+@app.before_request
+def start_request_timer():
+    request.environ["parking.start"] = time.perf_counter()
+
+@app.after_request
+def record_request_latency(resp):
+    start = request.environ.get("parking.start")
+    if start is not None:
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        metrics.observe("parking_http_request_seconds", time.perf_counter() - start, route=route, method=request.method, status=resp.status_code)
+    return resp
+
+metrics.collector("parking_video_feed_subscribers", "gauge", "Connected /video_feed clients per camera",
+                  lambda: [({"camera": cam_id}, hub.subscribers) for cam_id, hub in list(frame_hubs.items())])
+metrics.collector("parking_log_queue_depth", "gauge", "Events waiting for the background log writer",
+                  lambda: [({}, event_writer.queue.qsize())])
+metrics.collector("parking_camera_analyses_total", "counter", "Analysis ticks completed by each camera worker",
+                  lambda: [({"camera": i}, int(c[0].header[2])) for i, c in enumerate(camera_pool.cameras)] if camera_pool else [])
+
+@app.route('/metrics')
+def get_metrics():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
 # --- [ส่วนของ index() ที่แก้ไขใหม่] ---
 
 @app.route('/')
@@ -410,37 +1654,55 @@ def index():
                 });
             }
 
+            let state = { version: 0, stats: {}, slots: [] };
+
+            function applyUpdate(data) {
+                if (data.delta) data.slots.forEach(d => Object.assign(state.slots[d.id], d));
+                else state.slots = data.slots;
+                state.version = data.version; state.stats = data.stats;
+                render(state);
+            }
+
             function update() {
+                fetch('/api/all_data' + (state.version ? '?since=' + encodeURIComponent(state.version) : '')).then(r => r.status == 304 ? null : r.json()).then(data => { if (data) applyUpdate(data); });
+            }
+
+            function connect() {
+                if (!window.EventSource) { setInterval(update, 1000); return; }
+                const es = new EventSource('/api/stream');
+                es.addEventListener('snapshot', e => applyUpdate(JSON.parse(e.data)));
+                es.addEventListener('delta', e => applyUpdate(JSON.parse(e.data)));
+            }
+
+            function render(data) {
                 const myId = localStorage.getItem('mySlotId');
-                fetch('/api/all_data').then(r=>r.json()).then(data => {
-                    document.getElementById('f').innerText = data.stats.free;
-                    document.getElementById('r').innerText = data.stats.reserved;
-                    document.getElementById('o').innerText = data.stats.occupied;
-                    const select = document.getElementById('slotSelect');
-                    select.innerHTML = data.slots.map(s => `<option value="${s.id}" ${s.status!==0?'disabled':''}>ช่องที่ ${s.id+1} ${s.status==1?'(เต็ม)':s.status==2?'(จอง)':''}</option>`).join('');
+                document.getElementById('f').innerText = data.stats.free;
+                document.getElementById('r').innerText = data.stats.reserved;
+                document.getElementById('o').innerText = data.stats.occupied;
+                const select = document.getElementById('slotSelect');
+                select.innerHTML = data.slots.map(s => `<option value="${s.id}" ${s.status!==0?'disabled':''}>ช่องที่ ${s.id+1} ${s.status==1?'(เต็ม)':s.status==2?'(จอง)':''}</option>`).join('');
+                
+                const mySlot = data.slots.find(s => s.id == myId);
+                if(mySlot && mySlot.status == 2) {
+                    document.getElementById('bookingPanel').style.display = 'none';
+                    document.getElementById('activePanel').style.display = 'block';
+                    document.getElementById('slotLabel').innerText = "คุณจองช่อง " + (parseInt(myId)+1);
+                    document.getElementById('navBtn').href = "https://www.google.com/maps?q=" + mySlot.gps;
+                    document.getElementById('timeDisplay').innerText = Math.floor(mySlot.remaining/60).toString().padStart(2,'0')+":"+(mySlot.remaining%60).toString().padStart(2,'0');
                     
-                    const mySlot = data.slots.find(s => s.id == myId);
-                    if(mySlot && mySlot.status == 2) {
-                        document.getElementById('bookingPanel').style.display = 'none';
-                        document.getElementById('activePanel').style.display = 'block';
-                        document.getElementById('slotLabel').innerText = "คุณจองช่อง " + (parseInt(myId)+1);
-                        document.getElementById('navBtn').href = "https://www.google.com/maps?q=" + mySlot.gps;
-                        document.getElementById('timeDisplay').innerText = Math.floor(mySlot.remaining/60).toString().padStart(2,'0')+":"+(mySlot.remaining%60).toString().padStart(2,'0');
-                        
-                        if(mySlot.is_arrived) {
-                            document.getElementById('arrivalNotice').style.display = 'block';
-                            if(!arrivedAlert) { speak("ถึงที่จอดรถแล้วค่ะ"); arrivedAlert = true; }
-                        } else {
-                            document.getElementById('arrivalNotice').style.display = 'none';
-                            arrivedAlert = false;
-                        }
+                    if(mySlot.is_arrived) {
+                        document.getElementById('arrivalNotice').style.display = 'block';
+                        if(!arrivedAlert) { speak("ถึงที่จอดรถแล้วค่ะ"); arrivedAlert = true; }
                     } else {
-                        document.getElementById('bookingPanel').style.display = 'block';
-                        document.getElementById('activePanel').style.display = 'none';
                         document.getElementById('arrivalNotice').style.display = 'none';
                         arrivedAlert = false;
                     }
-                });
+                } else {
+                    document.getElementById('bookingPanel').style.display = 'block';
+                    document.getElementById('activePanel').style.display = 'none';
+                    document.getElementById('arrivalNotice').style.display = 'none';
+                    arrivedAlert = false;
+                }
             }
 
             function reserve() { 
@@ -458,14 +1720,264 @@ def index():
                 }); 
             }
 
-            setInterval(update, 1000);
             setInterval(updateChart, 30000); 
-            update();
+            connect();
         </script>
     </body>
     </html>
     """
 
+# --- [Async Server] ---
+class AsyncSignal:
+    """Wakes asyncio tasks when a vision-side thread publishes to a FrameHub or the StateFeed. The publishing
+    thread only schedules _fire() on the loop, so it never blocks on clients; each round hands out a fresh Event."""
+    def __init__(self, loop):
+        self.loop, self.event = loop, asyncio.Event()
+
+    def notify(self):
+        try: self.loop.call_soon_threadsafe(self._fire)
+        except RuntimeError: pass  # loop already closed at shutdown
+
+    def _fire(self):
+        event, self.event = self.event, asyncio.Event()
+        event.set()
+
+    async def wait(self, timeout):
+        try:
+            await asyncio.wait_for(self.event.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+def query_arg(scope, name, default, type):
+    values = urllib.parse.parse_qs(scope["query_string"].decode("latin-1")).get(name)
+    try: return type(values[0]) if values else default
+    except ValueError: return default
+
+def header_value(scope, name):
+    return b",".join(v for k, v in scope["headers"] if k == name).decode("latin-1")
+
+def wsgi_environ(scope, body):
+    server = scope.get("server") or ("localhost", 80)
+    environ = {"REQUEST_METHOD": scope["method"], "SCRIPT_NAME": scope.get("root_path", ""),
+               "PATH_INFO": scope["path"].encode("utf-8").decode("latin-1"), "QUERY_STRING": scope["query_string"].decode("latin-1"),
+               "SERVER_NAME": str(server[0]), "SERVER_PORT": str(server[1]), "SERVER_PROTOCOL": f"HTTP/{scope['http_version']}",
+               "REMOTE_ADDR": (scope.get("client") or ("", 0))[0], "CONTENT_LENGTH": str(len(body)),
+               "wsgi.version": (1, 0), "wsgi.url_scheme": scope.get("scheme", "http"), "wsgi.input": io.BytesIO(body),
+               "wsgi.errors": sys.stderr, "wsgi.multithread": True, "wsgi.multiprocess": False, "wsgi.run_once": False}
+    for name, value in scope["headers"]:
+        name, value = name.decode("latin-1").upper().replace("-", "_"), value.decode("latin-1")
+        if name == "CONTENT_LENGTH": continue
+        key = name if name == "CONTENT_TYPE" else "HTTP_" + name
+        environ[key] = environ[key] + "," + value if key in environ else value
+    return environ
+
+def call_wsgi(environ):
+    """Runs the Flask app for one buffered request on a worker thread: (status, headers, body)."""
+    started = []
+    result = app(environ, lambda status, headers, exc_info=None: started.extend((status, headers)))
+    try: body = b"".join(result)
+    finally:
+        if hasattr(result, "close"): result.close()
+    return int(started[0].split()[0]), started[1], body
+
+class AsyncServer:
+    """ASGI app for --server asgi, so one event loop holds thousands of clients instead of one thread each.
+    /video_feed, /api/stream and /api/all_data are native coroutines woken by AsyncSignal and reading the hubs'
+    and state feed's current values, which never block. Every other route runs the Flask app on a small thread pool.
+    Concurrent requests and streams are capped (503 beyond that). A stream only builds its next message once the
+    previous send has drained, so a slow client skips to the newest frame or a merged delta instead of queueing,
+    and a client that cannot take a send within ASYNC_SEND_TIMEOUT is evicted."""
+    def __init__(self, max_connections=ASYNC_MAX_CONNECTIONS, max_streams=ASYNC_MAX_STREAMS):
+        self.max_connections, self.max_streams = max_connections, max_streams
+        self.connections = self.streams = self.evicted = 0
+        self.loop, self.state_signal, self.frame_signals = None, None, {}
+        self.framed, self.events, self.full_body = {}, (None, {}), (None, b"")
+        self.executor = ThreadPoolExecutor(ASYNC_WSGI_THREADS, thread_name_prefix="asgi-wsgi")
+        self.routes = {"/video_feed": self.video_feed, "/api/stream": self.state_stream, "/api/all_data": self.all_data}
+
+    def _attach(self):
+        self.loop = asyncio.get_running_loop()
+        self.state_signal = AsyncSignal(self.loop)
+        state_feed.listeners.append(self.state_signal.notify)
+        for cam_id, hub in frame_hubs.items():
+            self.frame_signals[cam_id] = AsyncSignal(self.loop)
+            hub.listeners.append(self.frame_signals[cam_id].notify)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http": return
+        if self.loop is None: self._attach()
+        if self.connections >= self.max_connections:
+            return await self.respond(send, 503, b'{"status": "error", "reason": "server busy"}')
+        self.connections += 1
+        try:
+            handler = self.routes.get(scope["path"]) if scope["method"] == "GET" else None
+            await (handler or self.wsgi)(scope, receive, send)
+        finally:
+            self.connections -= 1
+
+    async def respond(self, send, status, body=b"", headers=(), content_type=b"application/json"):
+        head = [(b"content-type", content_type), (b"content-length", str(len(body)).encode())] if status != 304 else []
+        await send({"type": "http.response.start", "status": status, "headers": head + list(headers)})
+        await send({"type": "http.response.body", "body": body})
+
+    async def _read_body(self, receive):
+        chunks, size = [], 0
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect": return b""
+            chunks.append(message.get("body", b"")); size += len(chunks[-1])
+            if size > ASYNC_MAX_BODY: return None
+            if not message.get("more_body"): return b"".join(chunks)
+
+    async def wsgi(self, scope, receive, send):
+        try: body = await asyncio.wait_for(self._read_body(receive), ASYNC_IDLE_TIMEOUT)
+        except asyncio.TimeoutError: return await self.respond(send, 408, b'{"status": "error", "reason": "request body timeout"}')
+        if body is None: return await self.respond(send, 413, b'{"status": "error", "reason": "request body too large"}')
+        status, headers, data = await self.loop.run_in_executor(self.executor, call_wsgi, wsgi_environ(scope, body))
+        await send({"type": "http.response.start", "status": status,
+                    "headers": [(k.lower().encode("latin-1"), v.encode("latin-1")) for k, v in headers]})
+        await send({"type": "http.response.body", "body": data})
+
+    async def all_data(self, scope, receive, send):
+        start, snap = time.perf_counter(), state_feed.current
+        tags = {t.strip().removeprefix("W/").strip('"') for t in header_value(scope, b"if-none-match").split(",") if t.strip()}
+        payload = all_data_payload(snap, query_arg(scope, "since", None, str), lambda tag: tag in tags or "*" in tags)
+        if payload is None: body, status = b"", 304
+        elif payload.get("delta"): body, status = json.dumps(payload).encode(), 200
+        else:  # every poller without a usable `since` gets the same bytes, so serialize each version once
+            if self.full_body[0] != snap.version: self.full_body = (snap.version, json.dumps(payload).encode())
+            body, status = self.full_body[1], 200
+        await self.respond(send, status, body, [(b"etag", f'"{state_feed.tag(snap.version)}"'.encode())])
+        metrics.observe("parking_http_request_seconds", time.perf_counter() - start, route="/api/all_data", method="GET", status=status)
+
+    async def _disconnected(self, receive):
+        while (await receive())["type"] != "http.disconnect": pass
+
+    async def stream(self, receive, send, content_type, chunks):
+        """Sends an async generator of chunks (None = nothing to send this round) until the client disconnects."""
+        if self.streams >= self.max_streams:
+            return await self.respond(send, 503, b'{"status": "error", "reason": "too many streams"}')
+        self.streams += 1
+        disconnected = asyncio.ensure_future(self._disconnected(receive))
+        try:
+            await send({"type": "http.response.start", "status": 200,
+                        "headers": [(b"content-type", content_type), (b"cache-control", b"no-cache"), (b"x-accel-buffering", b"no")]})
+            while True:
+                # race the next chunk against the disconnect, so a client parked on a quiet hub leaves at once
+                pending = asyncio.ensure_future(chunks.__anext__())
+                await asyncio.wait((pending, disconnected), return_when=asyncio.FIRST_COMPLETED)
+                if not pending.done():
+                    pending.cancel()
+                    await asyncio.gather(pending, return_exceptions=True)
+                    break
+                try: chunk = pending.result()
+                except StopAsyncIteration: break
+                if chunk is None: continue
+                sending = asyncio.ensure_future(send({"type": "http.response.body", "body": chunk, "more_body": True}))
+                done, _ = await asyncio.wait((sending, disconnected), timeout=ASYNC_SEND_TIMEOUT, return_when=asyncio.FIRST_COMPLETED)
+                if sending not in done:
+                    sending.cancel()
+                    if not disconnected.done(): self.evicted += 1
+                    break
+        finally:
+            self.streams -= 1
+            disconnected.cancel()
+            await chunks.aclose()
+
+    async def _wait_change(self, signal, current, version):
+        """True once current() differs from `version`, False after ASYNC_KEEPALIVE seconds without a change."""
+        while current() == version:
+            if not await signal.wait(ASYNC_KEEPALIVE): return False
+        return True
+
+    async def video_feed(self, scope, receive, send):
+        cam_id, max_fps = feed_params(query_arg(scope, "cam", 0, int), query_arg(scope, "fps", STREAM_MAX_FPS, float))
+        if cam_id is None: return await self.respond(send, 404, b'{"status": "error"}')
+        hub, signal = frame_hubs[cam_id], self.frame_signals[cam_id]
+        async def chunks():
+            version, min_gap, last_sent = 0, 1.0 / max_fps, 0
+            while True:
+                await asyncio.sleep(max(0, last_sent + min_gap - self.loop.time()))
+                if not await self._wait_change(signal, lambda: hub.version, version):
+                    yield None; continue
+                version, frame = hub.version, hub.frame
+                if self.framed.get(cam_id, (None,))[0] != version:  # one multipart chunk per frame, shared by all viewers
+                    self.framed[cam_id] = (version, b'--frame\r\nContent-Type: image/jpeg\r\n\r\n' + frame + b'\r\n')
+                last_sent = self.loop.time()
+                yield self.framed[cam_id][1]
+        with hub.cond: hub.subscribers += 1
+        try: await self.stream(receive, send, b"multipart/x-mixed-replace; boundary=frame", chunks())
+        finally:
+            with hub.cond: hub.subscribers -= 1
+
+    def _state_event(self, snap, since=None):
+        """state_event() encoded once per (version, since): clients that kept up all share one delta."""
+        if self.events[0] != snap.version: self.events = (snap.version, {})
+        cache = self.events[1]
+        if since not in cache: cache[since] = state_event(snap, since).encode()
+        return cache[since]
+
+    async def state_stream(self, scope, receive, send):
+        async def chunks():
+            snap = state_feed.current
+            yield self._state_event(snap)
+            while True:
+                if not await self._wait_change(self.state_signal, lambda: state_feed.current.version, snap.version):
+                    yield b": keepalive\n\n"; continue
+                prev, snap = snap, state_feed.current
+                yield self._state_event(snap, prev.version)
+        await self.stream(receive, send, b"text/event-stream", chunks())
+
+async_app = AsyncServer()
+metrics.collector("parking_async_clients", "gauge", "Open requests and streams on the asyncio server",
+                  lambda: [({"kind": "requests"}, async_app.connections), ({"kind": "streams"}, async_app.streams)])
+metrics.collector("parking_async_evicted_total", "counter", "Stream clients dropped for not draining a send within ASYNC_SEND_TIMEOUT",
+                  lambda: [({}, async_app.evicted)])
+
+def run_async_server(host="0.0.0.0", port=5001):
+    config = uvicorn.Config(async_app, host=host, port=port, lifespan="off", log_level="warning", timeout_keep_alive=ASYNC_IDLE_TIMEOUT)
+    uvicorn.Server(config).run()
+
 if __name__ == '__main__':
-    threading.Thread(target=lambda: app.run(host='0.0.0.0', port=5001, threaded=True, use_reloader=False), daemon=True).start()
-    main_process()
\ No newline at end of file
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--source", default="0", help="camera index, RTSP URL or video file for single-camera mode")
+    parser.add_argument("--cameras", help='JSON list of {"source": ..., "layout": ...}, one worker process per camera')
+    parser.add_argument("--no-motion-gate", action="store_true", help="rescore every slot on a fixed ANALYSIS_INTERVAL")
+    parser.add_argument("--queue-size", type=int, default=PIPELINE_QUEUE_SIZE, help="frames buffered between pipeline stages")
+    parser.add_argument("--drop-policy", choices=["latest", "drop_new", "block"], default=DROP_POLICY, help="what a full stage queue does with new frames")
+    parser.add_argument("--capture-size", type=parse_size, default=CAPTURE_SIZE, help="requested camera resolution WxH; layouts are drawn in these pixels")
+    parser.add_argument("--analysis-scale", type=float, default=ANALYSIS_SCALE, help="downscale factor applied to the slot ROI before thresholding")
+    parser.add_argument("--no-roi-crop", action="store_true", help="threshold the whole frame instead of the union of slot boxes")
+    parser.add_argument("--stream-overlay", choices=["public", "editor", "none"], default=STREAM_OVERLAY, help="slot overlay on /video_feed: status only, the editor view with selection, or a clean frame")
+    parser.add_argument("--stream-size", type=parse_size, default=STREAM_SIZE, help="resolution WxH of /video_feed frames (default: capture size)")
+    parser.add_argument("--server", choices=["flask", "asgi"], default="flask", help="web tier: Flask threads, or one asyncio loop under uvicorn for many clients")
+    args = parser.parse_args()
+    if args.server == "asgi" and uvicorn is None: parser.error("--server asgi needs uvicorn (pip install uvicorn)")
+    MOTION_GATE = not args.no_motion_gate
+    CAPTURE_SIZE, ANALYSIS_SCALE, ROI_CROP, STREAM_SIZE = args.capture_size, args.analysis_scale, not args.no_roi_crop, args.stream_size
+    occupancy = OccupancyEngine(ANALYSIS_SCALE, ROI_CROP)
+
+    rollup.load()
+    atexit.register(rollup.save)
+    threading.Thread(target=reservations.run, daemon=True).start()
+    event_writer.start()
+    atexit.register(event_writer.close)
+    threading.Thread(target=rollup.autosave, daemon=True).start()
+
+    if args.cameras:
+        with open(args.cameras) as f: camera_pool = CameraPool(json.load(f))
+        slots, slot_cameras = SlotStore.from_rows(camera_pool.layout), camera_pool.slot_cameras
+        camera_pool.start()
+    else:
+        slots = SlotStore.from_rows(load_data())
+        cap = open_capture(args.source, CAPTURE_SIZE)
+        threading.Thread(target=layout_saver.run, daemon=True).start()
+        atexit.register(layout_saver.flush)
+    if args.server == "asgi": threading.Thread(target=run_async_server, daemon=True).start()
+    else: threading.Thread(target=lambda: app.run(host='0.0.0.0', port=5001, threaded=True, use_reloader=False), daemon=True).start()
+    try:
+        if camera_pool: multi_camera_process()
+        else: main_process(args.queue_size, args.drop_policy, args.stream_overlay)
+    finally:
+        if camera_pool: camera_pool.stop()
\ No newline at end of file
@@ -0,0 +1,25 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import aggregator
+
+@pytest.mark.parametrize("path", ["/api/lots", "/api/reserve", "/api/extend", "/api/cancel", "/api/batch"])
+@pytest.mark.parametrize("body", [[1], "north", 3, None])
+def test_non_object_body_is_rejected(path, body):
+    resp = aggregator.app.test_client().post(path, json=body)
+    assert resp.status_code == 400
+    assert resp.get_json()["status"] == "error"
+
+@pytest.mark.parametrize("path", ["/api/reserve", "/api/batch"])
+@pytest.mark.parametrize("lot", ["missing", ["north"], {"name": "north"}, None])
+def test_unknown_lot_is_not_found(path, lot):
+    resp = aggregator.app.test_client().post(path, json={"lot": lot, "slot_id": 0, "ops": []})
+    assert resp.status_code == 404
+
+def test_register_lot_rejects_missing_fields_and_bad_urls():
+    client = aggregator.app.test_client()
+    assert client.post("/api/lots", json={"name": "north"}).status_code == 400
+    assert client.post("/api/lots", json={"name": "north", "url": "ftp://lot"}).status_code == 400
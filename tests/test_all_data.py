@@ -0,0 +1,39 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import main
+
+def view(*statuses):
+    return [{"id": i, "status": st, "remaining": 0, "is_arrived": False} for i, st in enumerate(statuses)]
+
+@pytest.fixture
+def feed(monkeypatch):
+    feed = main.StateFeed()
+    monkeypatch.setattr(main, "state_feed", feed)
+    feed.publish(1, view(0, 0), {"free": 2}, np.zeros(2, np.int8))
+    feed.publish(2, view(1, 0), {"free": 1}, np.array([1, 0], np.int8))
+    return feed
+
+def test_version_and_etag_carry_the_process_epoch(feed):
+    resp = main.app.test_client().get("/api/all_data")
+    assert resp.get_json()["version"] == f"{feed.epoch}.2"
+    assert resp.headers["ETag"] == f'"{feed.epoch}.2"'
+
+def test_since_in_this_epoch_gets_a_delta_or_304(feed):
+    client = main.app.test_client()
+    data = client.get(f"/api/all_data?since={feed.epoch}.1").get_json()
+    assert data["delta"] and data["slots"] == [{"id": 0, "status": 1, "remaining": 0, "is_arrived": False}]
+    assert client.get(f"/api/all_data?since={feed.epoch}.2").status_code == 304
+
+@pytest.mark.parametrize("since", ["1", "2", "deadbeef.1", "deadbeef.2", "x"])
+def test_since_from_another_process_gets_the_full_snapshot(feed, since):
+    resp = main.app.test_client().get(f"/api/all_data?since={since}", headers={"If-None-Match": '"2"'})
+    data = resp.get_json()
+    assert resp.status_code == 200 and "delta" not in data and len(data["slots"]) == 2
+
+def test_epochs_differ_between_feeds():
+    assert main.StateFeed().epoch != main.StateFeed().epoch
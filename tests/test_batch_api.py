@@ -0,0 +1,72 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import main
+
+SQUARE = [[0, 0], [40, 0], [40, 40], [0, 40]]
+
+@pytest.fixture
+def client(monkeypatch):
+    """Three free slots with slot 1 occupied, on a fresh store and reservation engine."""
+    store = main.SlotStore.from_rows([[SQUARE]] * 3)
+    store.status[1] = 1
+    monkeypatch.setattr(main, "slots", store)
+    monkeypatch.setattr(main, "reservations", main.ReservationEngine())
+    return main.app.test_client()
+
+def statuses():
+    return main.slots.status.tolist()
+
+@pytest.mark.parametrize("path", ["/api/reserve", "/api/batch"])
+@pytest.mark.parametrize("body", [[1], "reserve", 3, None])
+def test_non_object_body_is_rejected(client, path, body):
+    resp = client.post(path, json=body)
+    assert resp.status_code == 400
+    assert resp.get_json()["status"] == "error"
+
+@pytest.mark.parametrize("ops", [None, [], {"op": "reserve"}, [{"op": "reserve", "slot_id": 0}] * (main.MAX_BATCH_OPS + 1)])
+def test_batch_rejects_bad_ops_list(client, ops):
+    assert client.post("/api/batch", json={"ops": ops}).status_code == 400
+    assert statuses() == [0, 1, 0]
+
+def test_batch_reports_malformed_ops_per_entry(client):
+    resp = client.post("/api/batch", json={"ops": [{"op": ["reserve"], "slot_id": 0}, "reserve", {"op": "reserve", "slot_id": True},
+                                                   {"op": "reserve", "slot_id": "2"}]})
+    assert resp.status_code == 200
+    data = resp.get_json()
+    assert data["status"] == "partial"
+    assert [r.get("reason") for r in data["results"]] == ["unknown op", "unknown op", "no such slot", None]
+    assert statuses() == [0, 1, 2]
+
+def test_batch_applies_valid_ops_and_reports_partial(client):
+    resp = client.post("/api/batch", json={"ops": [{"op": "reserve", "slot_id": 0}, {"op": "reserve", "slot_id": 1},
+                                                   {"op": "reserve", "slot_id": 0}, {"op": "extend", "slot_id": 0}]})
+    data = resp.get_json()
+    assert resp.status_code == 200 and data["applied"] and data["status"] == "partial"
+    assert [r["status"] for r in data["results"]] == ["success", "error", "error", "success"]
+    assert [r.get("reason") for r in data["results"]][1:3] == ["slot not free", "slot not free"]
+    assert statuses() == [2, 1, 0]
+
+def test_batch_all_or_nothing_applies_nothing_on_any_error(client):
+    resp = client.post("/api/batch", json={"ops": [{"op": "reserve", "slot_id": 0}, {"op": "reserve", "slot_id": 1}], "all_or_nothing": True})
+    data = resp.get_json()
+    assert resp.status_code == 409 and not data["applied"] and data["status"] == "error"
+    assert [r["status"] for r in data["results"]] == ["skipped", "error"]
+    assert statuses() == [0, 1, 0]
+
+def test_batch_all_or_nothing_applies_everything_when_valid(client):
+    resp = client.post("/api/batch", json={"ops": [{"op": "reserve", "slot_id": 0}, {"op": "reserve", "slot_id": 2},
+                                                   {"op": "cancel", "slot_id": 0}], "all_or_nothing": True})
+    data = resp.get_json()
+    assert resp.status_code == 200 and data["status"] == "success"
+    assert statuses() == [0, 1, 2]
+
+def test_single_op_rejects_unknown_slot_and_applies_valid_one(client):
+    assert client.post("/api/reserve", json={"slot_id": 9}).status_code == 400
+    assert client.post("/api/reserve", json={"slot_id": 1}).status_code == 400
+    assert client.post("/api/reserve", json={"slot_id": "2"}).get_json() == {"status": "success"}
+    assert client.post("/api/cancel", json={"slot_id": 2}).status_code == 200
+    assert statuses() == [0, 1, 0]